@@ -0,0 +1,260 @@
+# Copyright (c) 2025 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import collections
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+import eventlet
+from eventlet import event
+from oslo_log import log as logging
+
+from cinder import exception
+from cinder.i18n import _
+from cinder.volume.drivers.fusionstorage import constants
+
+LOG = logging.getLogger(__name__)
+
+
+class _Job(object):
+    def __init__(self, name, pool_id, func, resources):
+        self.name = name
+        self.pool_id = pool_id
+        self.func = func
+        self.resources = set(resources)
+        self.started = False
+
+
+class PoolJobQueue(object):
+    """Runs background jobs with a concurrency limit per storage pool.
+
+    Jobs of a pool start in submission order as soon as fewer than
+    per_pool_limit jobs of that pool are running. A job names the array
+    objects it uses, so that they are reported busy until it finishes.
+    A running job calls start() before it changes the array, until then
+    it can still be cancelled.
+    """
+
+    def __init__(self, per_pool_limit):
+        self.per_pool_limit = max(int(per_pool_limit), 1)
+        self._lock = threading.Lock()
+        self._pending = collections.defaultdict(collections.deque)
+        self._running = collections.defaultdict(int)
+        self._jobs = {}
+
+    def submit(self, pool_id, name, func, resources=()):
+        job = _Job(name, pool_id, func, resources)
+        with self._lock:
+            if name in self._jobs:
+                LOG.info("Background job %s is already queued.", name)
+                return
+            self._jobs[name] = job
+            self._pending[pool_id].append(job)
+        LOG.info("Queue background job %(name)s of pool %(pool)s.",
+                 {"name": name, "pool": pool_id})
+        self._dispatch(pool_id)
+
+    def start(self, name):
+        """Mark a job as started, return False if it was cancelled."""
+        with self._lock:
+            job = self._jobs.get(name)
+            if job:
+                job.started = True
+            return bool(job)
+
+    def cancel(self, name):
+        """Drop a job that has not started, return whether it was found."""
+        with self._lock:
+            job = self._jobs.get(name)
+            if not job or job.started:
+                return False
+            if job in self._pending[job.pool_id]:
+                self._pending[job.pool_id].remove(job)
+            self._jobs.pop(name)
+        LOG.info("Cancel background job %s.", name)
+        return True
+
+    def is_running(self, name):
+        with self._lock:
+            job = self._jobs.get(name)
+            return bool(job) and job.started
+
+    def is_queued(self, name):
+        return name in self._jobs
+
+    def is_busy(self, resource):
+        with self._lock:
+            return any(resource in job.resources
+                       for job in self._jobs.values())
+
+    def _dispatch(self, pool_id):
+        jobs = []
+        with self._lock:
+            pending = self._pending[pool_id]
+            while pending and self._running[pool_id] < self.per_pool_limit:
+                jobs.append(pending.popleft())
+                self._running[pool_id] += 1
+        for job in jobs:
+            eventlet.spawn_n(self._run, job)
+
+    def _run(self, job):
+        LOG.info("Start background job %s.", job.name)
+        try:
+            job.func()
+        except Exception:
+            LOG.exception("Background job %s failed.", job.name)
+        finally:
+            with self._lock:
+                self._running[job.pool_id] -= 1
+                if self._jobs.get(job.name) is job:
+                    self._jobs.pop(job.name)
+            self._dispatch(job.pool_id)
+
+
+class _PoolSlots(object):
+    def __init__(self):
+        self.running = 0
+        self.waiters = []
+        self.wait_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.load_average = None
+
+
+class JobScheduler(object):
+    """Admission control for the heavy array jobs of each storage pool.
+
+    Full clones, LUN migrations and snapshot rollbacks load the disks of
+    a pool for a long time. At most per_pool_limit of them run in a pool
+    at once, the others wait in a queue ordered by the priority of their
+    job type and then by arrival, at most wait_timeout seconds.
+
+    The running and queued jobs of a pool are also sampled into a moving
+    average, in which the newest sample weighs load_smoothing.
+    """
+
+    def __init__(self, per_pool_limit, wait_timeout,
+                 load_smoothing=constants.DEFAULT_HEAVY_JOB_LOAD_SMOOTHING):
+        self.per_pool_limit = max(int(per_pool_limit), 1)
+        self.wait_timeout = max(int(wait_timeout), 1)
+        self.load_smoothing = min(max(float(load_smoothing), 0.0), 1.0) or 1.0
+        self._lock = threading.Lock()
+        self._pools = collections.defaultdict(_PoolSlots)
+        self._counter = itertools.count()
+
+    @contextlib.contextmanager
+    def admit(self, pool_id, job_type, name):
+        start = time.time()
+        waiter = None
+        with self._lock:
+            slots = self._pools[pool_id]
+            if slots.running < self.per_pool_limit and not slots.waiters:
+                slots.running += 1
+            else:
+                waiter = event.Event()
+                heapq.heappush(slots.waiters, (
+                    constants.JOB_PRIORITIES.get(job_type, len(
+                        constants.JOB_PRIORITIES)),
+                    next(self._counter), waiter))
+
+        if waiter:
+            LOG.info("Heavy job %(name)s of pool %(pool)s waits for a "
+                     "free slot.", {"name": name, "pool": pool_id})
+            try:
+                with eventlet.Timeout(self.wait_timeout, False):
+                    waiter.wait()
+            except BaseException:
+                self._abandon(pool_id, waiter)
+                raise
+            if not waiter.ready():
+                self._abandon(pool_id, waiter)
+                msg = (_('Heavy job %(name)s of pool %(pool)s found no free '
+                         'slot in %(timeout)s seconds.')
+                       % {'name': name, 'pool': pool_id,
+                          'timeout': self.wait_timeout})
+                LOG.error(msg)
+                raise exception.VolumeBackendAPIException(data=msg)
+        self._record_wait(pool_id, time.time() - start)
+
+        LOG.info("Start heavy job %(name)s of type %(type)s in pool "
+                 "%(pool)s.", {"name": name, "type": job_type,
+                               "pool": pool_id})
+        try:
+            yield
+        finally:
+            self._release(pool_id)
+            LOG.info("Heavy job %(name)s of pool %(pool)s finished.",
+                     {"name": name, "pool": pool_id})
+
+    def _release(self, pool_id):
+        with self._lock:
+            slots = self._pools[pool_id]
+            if slots.waiters:
+                # The slot goes straight to the next job, running stays.
+                __, __, waiter = heapq.heappop(slots.waiters)
+                waiter.send()
+            else:
+                slots.running -= 1
+
+    def _abandon(self, pool_id, waiter):
+        with self._lock:
+            slots = self._pools[pool_id]
+            for index, item in enumerate(slots.waiters):
+                if item[2] is waiter:
+                    slots.waiters.pop(index)
+                    heapq.heapify(slots.waiters)
+                    return
+        # The slot was handed over before the wait was interrupted.
+        self._release(pool_id)
+
+    def _record_wait(self, pool_id, wait_time):
+        with self._lock:
+            slots = self._pools[pool_id]
+            slots.wait_count += 1
+            slots.total_wait += wait_time
+            slots.max_wait = max(slots.max_wait, wait_time)
+
+    def get_load(self, pool_id):
+        """Return the running and queued heavy job counts of a pool."""
+        with self._lock:
+            slots = self._pools[pool_id]
+            return slots.running, len(slots.waiters)
+
+    def sample_load(self, pool_id):
+        """Sample the job count of a pool and return its moving average."""
+        with self._lock:
+            slots = self._pools[pool_id]
+            load = slots.running + len(slots.waiters)
+            if slots.load_average is not None:
+                load = (self.load_smoothing * load +
+                        (1 - self.load_smoothing) * slots.load_average)
+            slots.load_average = load
+            return load
+
+    def get_stats(self, pool_id):
+        with self._lock:
+            slots = self._pools[pool_id]
+            avg_wait = (slots.total_wait / slots.wait_count
+                        if slots.wait_count else 0)
+            return {
+                "heavy_job_running": slots.running,
+                "heavy_job_queue_depth": len(slots.waiters),
+                "heavy_job_avg_wait_time": round(avg_wait, 2),
+                "heavy_job_max_wait_time": round(slots.max_wait, 2),
+            }
@@ -0,0 +1,225 @@
+# Copyright (c) 2025 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import collections
+import threading
+
+from oslo_log import log as logging
+from oslo_service import loopingcall
+
+from cinder import coordination
+
+LOG = logging.getLogger(__name__)
+
+
+class _Master(object):
+    def __init__(self, name, index, link_count=0):
+        self.name = name
+        self.index = index
+        self.link_count = link_count
+
+
+class TemplateManager(object):
+    """Linked clone templates of the images, the quick start of Mitaka.
+
+    An image is copied once per storage pool into a template volume, the
+    template snapshot marks the copy as complete. The volumes of the
+    image are linked clones of master snapshots of the template volume,
+    each master serves at most max_link_num of them. When all masters of
+    an image and pool are full the next master is taken. The names are
+    derived from the image and pool, the link counts are kept in memory
+    and rebuilt from the volumes when the driver starts.
+
+    A refiller takes the next master in the background once the used
+    links of an image and pool pass high_water of their capacity, so
+    that volume creation does not wait for a new master.
+    """
+
+    def __init__(self, client, max_link_num, delete_master=False,
+                 high_water=1.0):
+        self.client = client
+        self.max_link_num = max(int(max_link_num), 1)
+        self.delete_master = delete_master
+        self.high_water = high_water
+        self._lock = threading.Lock()
+        self._masters = collections.defaultdict(list)
+        self._owners = {}
+        self._timer = None
+
+    def start(self, interval):
+        if interval <= 0 or self._timer:
+            return
+        self._timer = loopingcall.FixedIntervalLoopingCall(self._refill)
+        self._timer.start(interval=interval, initial_delay=interval)
+
+    def _needs_master(self, key):
+        masters = self._masters[key]
+        if not masters:
+            return False
+        capacity = len(masters) * self.max_link_num
+        used = sum(master.link_count for master in masters)
+        return used >= capacity * self.high_water
+
+    def _refill(self):
+        with self._lock:
+            keys = [key for key in list(self._masters)
+                    if self._needs_master(key)]
+        for image_id, pool_id in keys:
+            try:
+                self._refill_master(image_id, pool_id)
+            except Exception as err:
+                LOG.warning("Refill master snapshot of image %(image)s in "
+                            "pool %(pool)s failed. Reason: %(err)s",
+                            {"image": image_id, "pool": pool_id,
+                             "err": err})
+
+    def _refill_master(self, image_id, pool_id):
+        @coordination.synchronized('huawei-template-{image_id}-{pool_id}')
+        def _refill_master_locked(image_id, pool_id):
+            with self._lock:
+                needs_master = self._needs_master((image_id, pool_id))
+            template_snap = self.get_template_snapshot_name(image_id, pool_id)
+            if needs_master and self.client.get_snapshot_by_name(
+                    pool_id, template_snap):
+                LOG.info("Links of image %(image)s in pool %(pool)s are "
+                         "running out, take the next master in advance.",
+                         {"image": image_id, "pool": pool_id})
+                self._create_master(image_id, pool_id)
+
+        _refill_master_locked(image_id, pool_id)
+
+    @staticmethod
+    def get_template_volume_name(image_id, pool_id):
+        return 'template-vol-%s-%s' % (image_id, pool_id)
+
+    @staticmethod
+    def get_template_snapshot_name(image_id, pool_id):
+        return 'template-snap-%s-%s' % (image_id, pool_id)
+
+    @staticmethod
+    def get_master_snapshot_name(image_id, pool_id, index):
+        return 'master-snap-%s-%s-%s' % (image_id, pool_id, index)
+
+    def _find_master(self, key, name):
+        for master in self._masters[key]:
+            if master.name == name:
+                return master
+        return None
+
+    def _reserve_link(self, key):
+        with self._lock:
+            for master in self._masters[key]:
+                if master.link_count < self.max_link_num:
+                    master.link_count += 1
+                    return master.name
+        return None
+
+    def get_available_master(self, image_id, pool_id):
+        """Reserve a link of a master with headroom, None if all are full."""
+        return self._reserve_link((image_id, pool_id))
+
+    def register_link(self, image_id, pool_id, master_name):
+        """Count a volume linked to the master, used at driver start."""
+        key = (image_id, pool_id)
+        with self._lock:
+            master = self._find_master(key, master_name)
+            if not master:
+                index = int(master_name.rsplit('-', 1)[-1])
+                master = _Master(master_name, index)
+                self._masters[key].append(master)
+                self._masters[key].sort(key=lambda item: item.index)
+                self._owners[master_name] = key
+            master.link_count += 1
+
+    def release_link(self, master_name):
+        """Forget a deleted volume of the master."""
+        with self._lock:
+            key = self._owners.get(master_name)
+            master = self._find_master(key, master_name) if key else None
+            if not master:
+                return
+            master.link_count = max(master.link_count - 1, 0)
+            if master.link_count or not self.delete_master:
+                return
+            self._masters[key].remove(master)
+            self._owners.pop(master_name)
+
+        LOG.info("Master snapshot %s has no volume left, delete it.",
+                 master_name)
+        try:
+            self.client.delete_snapshot(master_name)
+        except Exception as err:
+            LOG.warning("Delete master snapshot %(snap)s failed. "
+                        "Reason: %(err)s", {"snap": master_name, "err": err})
+
+    def extend_master(self, image_id, pool_id, create_template):
+        """Take a new master of the image and reserve a link of it.
+
+        The template volume is created first when the pool has none,
+        create_template(vol_name) creates it and copies the image to it.
+        """
+        @coordination.synchronized('huawei-template-{image_id}-{pool_id}')
+        def _extend_master(image_id, pool_id):
+            # Another request may have taken a master while this one waited.
+            master_name = self.get_available_master(image_id, pool_id)
+            if master_name:
+                return master_name
+
+            self._ensure_template(image_id, pool_id, create_template)
+            self._create_master(image_id, pool_id)
+            return self.get_available_master(image_id, pool_id)
+
+        return _extend_master(image_id, pool_id)
+
+    def _ensure_template(self, image_id, pool_id, create_template):
+        template_snap = self.get_template_snapshot_name(image_id, pool_id)
+        if self.client.get_snapshot_by_name(pool_id, template_snap):
+            return
+
+        template_vol = self.get_template_volume_name(image_id, pool_id)
+        LOG.info("Create template %(vol)s of image %(image)s in pool "
+                 "%(pool)s.", {"vol": template_vol, "image": image_id,
+                               "pool": pool_id})
+        # A template volume without its snapshot is left from an
+        # interrupted copy.
+        if self.client.query_volume_by_name(template_vol):
+            self.client.delete_volume(template_vol)
+        create_template(template_vol)
+        try:
+            self.client.create_snapshot(template_snap, template_vol)
+        except Exception:
+            self.client.delete_volume(template_vol)
+            raise
+
+    def _create_master(self, image_id, pool_id):
+        key = (image_id, pool_id)
+        with self._lock:
+            used = set(master.index for master in self._masters[key])
+        index = min(set(range(len(used) + 1)) - used)
+        master_name = self.get_master_snapshot_name(image_id, pool_id, index)
+
+        # A master of an earlier run without volumes is used again.
+        if not self.client.get_snapshot_by_name(pool_id, master_name):
+            self.client.create_snapshot(
+                master_name, self.get_template_volume_name(image_id, pool_id))
+        LOG.info("Master snapshot %(snap)s of image %(image)s is ready.",
+                 {"snap": master_name, "image": image_id})
+
+        with self._lock:
+            self._masters[key].append(_Master(master_name, index))
+            self._masters[key].sort(key=lambda item: item.index)
+            self._owners[master_name] = key
+        return master_name
@@ -13,17 +13,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import json
-import time
 import uuid
-from multiprocessing import Lock
 
 import six
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
 from oslo_utils import units
-from oslo_service import loopingcall
 
 from cinder import coordination
 from cinder import exception
@@ -32,10 +30,15 @@ from cinder import interface
 from cinder import objects
 from cinder.volume import driver
 from cinder.volume.drivers.fusionstorage import constants
+from cinder.volume.drivers.fusionstorage import fs_batch
+from cinder.volume.drivers.fusionstorage import fs_cache
 from cinder.volume.drivers.fusionstorage import fs_client
 from cinder.volume.drivers.fusionstorage import fs_conf
 from cinder.volume.drivers.fusionstorage import fs_flow
+from cinder.volume.drivers.fusionstorage import fs_jobs
+from cinder.volume.drivers.fusionstorage import fs_poller
 from cinder.volume.drivers.fusionstorage import fs_qos
+from cinder.volume.drivers.fusionstorage import fs_template
 from cinder.volume.drivers.fusionstorage import fs_utils
 from cinder.volume.drivers.fusionstorage import customization_driver
 from cinder.volume.drivers.san import san
@@ -114,6 +117,138 @@ volume_opts = [
     cfg.IntOpt('rest_timeout',
                default=constants.DEFAULT_TIMEOUT,
                help='timeout when call storage restful api.'),
+    cfg.IntOpt('page_fetch_concurrency',
+               default=constants.DEFAULT_PAGE_FETCH_WORKERS,
+               help='The maximum number of list pages requested from the '
+                    'array at the same time when scanning all volumes or '
+                    'snapshots of a storage pool.'),
+    cfg.IntOpt('storage_pool_cache_ttl',
+               default=constants.DEFAULT_POOL_CACHE_TTL,
+               help='The interval in seconds at which the storage pool '
+                    'information is refreshed in the background. '
+                    '0 means querying the array every time.'),
+    cfg.IntOpt('array_topology_cache_ttl',
+               default=constants.DEFAULT_TOPOLOGY_CACHE_TTL,
+               help='The interval in seconds after which the cached hosts, '
+                    'host groups, initiators and LUN mappings used by iSCSI '
+                    'attach and detach are reloaded from the array. '
+                    '0 means querying the array every time.'),
+    cfg.FloatOpt('iscsi_mapping_batch_window',
+                 default=constants.DEFAULT_MAPPING_BATCH_WINDOW,
+                 help='The extra time in seconds to collect iSCSI attach '
+                      'requests for the same host, so that their LUNs are '
+                      'mapped to the host in one request. Requests that '
+                      'arrive while a mapping of the host is running are '
+                      'always mapped together afterwards, 0 means sending '
+                      'a request at once when no mapping is running.'),
+    cfg.IntOpt('iscsi_portal_cache_ttl',
+               default=constants.DEFAULT_PORTAL_CACHE_TTL,
+               help='The interval in seconds at which the iSCSI portals of '
+                    'the array are probed in the background. '
+                    '0 means querying the array every time.'),
+    cfg.IntOpt('iscsi_session_count_interval',
+               default=constants.DEFAULT_SESSION_COUNT_INTERVAL,
+               help='The interval in seconds at which the iSCSI sessions of '
+                    'all hosts of the array are counted, to pick the least '
+                    'loaded portals. It is only used with '
+                    'iscsi_manager_groups or when the links are not '
+                    'balanced by the storage pool. 0 means only counting '
+                    'the sessions created by this driver.'),
+    cfg.DictOpt('poll_schedules',
+                default={},
+                help='The polling schedule per operation type, the types '
+                     'are clone, migration, rollback and volume_ready, the '
+                     'schedules are fixed, exponential, progress and '
+                     'capped. For example: '
+                     '"poll_schedules = clone:exponential,migration:fixed"'),
+    cfg.BoolOpt('full_clone_async',
+                default=False,
+                help='Whether a full clone returns as soon as the target '
+                     'volume is created and copies the data in the '
+                     'background. The volume can not be attached until the '
+                     'copy finishes.'),
+    cfg.IntOpt('full_clone_pool_concurrency',
+               default=constants.DEFAULT_HYDRATION_CONCURRENCY,
+               help='The maximum number of background full clone copies '
+                    'running at the same time in one storage pool.'),
+    cfg.IntOpt('heavy_jobs_per_pool',
+               default=constants.DEFAULT_HEAVY_JOBS_PER_POOL,
+               help='The maximum number of full clones, LUN migrations and '
+                    'snapshot rollbacks running at the same time in one '
+                    'storage pool, the others wait in a priority queue.'),
+    cfg.IntOpt('group_operation_concurrency',
+               default=constants.DEFAULT_GROUP_OPERATION_WORKERS,
+               help='The maximum number of volumes or snapshots handled at '
+                    'the same time by one group or group snapshot '
+                    'operation.'),
+    cfg.FloatOpt('volume_delete_batch_window',
+                 default=constants.DEFAULT_DELETE_BATCH_WINDOW,
+                 help='The extra time in seconds to collect volume '
+                      'deletes, so that they are sent to the array in one '
+                      'request. Deletes that arrive while a delete request '
+                      'is running are always sent together afterwards, 0 '
+                      'means sending a delete at once when none is '
+                      'running.'),
+    cfg.BoolOpt('volume_delete_async',
+                default=False,
+                help='Whether deleting a volume returns before the array has '
+                     'deleted it. A failed delete is only logged.'),
+    cfg.BoolOpt('qos_policy_shared',
+                default=False,
+                help='Whether the volumes with the same QoS specs share one '
+                     'QoS policy on the array instead of a policy per '
+                     'volume.'),
+    cfg.IntOpt('cluster_facts_cache_ttl',
+               default=constants.DEFAULT_CLUSTER_FACTS_TTL,
+               help='The time in seconds the FSM version, time zone and '
+                    'time config of the array are cached for the QoS '
+                    'scheduling, they are also reloaded at each login. '
+                    '0 means querying the array every time.'),
+    cfg.IntOpt('stats_collect_interval',
+               default=constants.DEFAULT_STATS_INTERVAL,
+               help='The interval in seconds at which the pool capacity is '
+                    'collected in the background for the volume stats. '
+                    '0 means collecting it when the stats are reported.'),
+    cfg.IntOpt('stats_max_age',
+               default=constants.DEFAULT_STATS_MAX_AGE,
+               help='The age in seconds after which the volume stats are '
+                    'collected synchronously when they are reported, '
+                    'because the background collection fell behind.'),
+    cfg.BoolOpt('quickstart_enabled',
+                default=False,
+                help='Whether volumes created from an image are linked '
+                     'clones of a master snapshot of the image, the image '
+                     'is copied once per storage pool.'),
+    cfg.IntOpt('quickstart_max_link_num',
+               default=constants.DEFAULT_QUICKSTART_MAX_LINK_NUM,
+               help='The maximum number of volumes linked to one master '
+                    'snapshot of an image.'),
+    cfg.BoolOpt('quickstart_delete_master',
+                default=False,
+                help='Whether to delete a master snapshot when its last '
+                     'linked volume is deleted.'),
+    cfg.IntOpt('quickstart_refill_interval',
+               default=constants.DEFAULT_QUICKSTART_REFILL_INTERVAL,
+               help='The interval in seconds at which the link usage of the '
+                    'master snapshots is checked in the background. '
+                    '0 means taking a new master only when a volume '
+                    'finds all masters full.'),
+    cfg.FloatOpt('quickstart_high_water',
+                 default=constants.DEFAULT_QUICKSTART_HIGH_WATER,
+                 help='The ratio of used links of all masters of an image '
+                      'in a pool at which the next master is taken in '
+                      'the background.'),
+    cfg.IntOpt('heavy_job_wait_timeout',
+               default=constants.DEFAULT_HEAVY_JOB_WAIT_TIMEOUT,
+               help='The maximum time in seconds a full clone, LUN '
+                    'migration or snapshot rollback waits for a free slot '
+                    'in its storage pool before it fails.'),
+    cfg.FloatOpt('heavy_job_load_smoothing',
+                 default=constants.DEFAULT_HEAVY_JOB_LOAD_SMOOTHING,
+                 help='The weight between 0 and 1 of the newest sample in '
+                      'the moving average of the running and queued heavy '
+                      'jobs of a pool, reported as heavy_job_load for use '
+                      'in goodness_function and filter_function.'),
 ]
 
 CONF = cfg.CONF
@@ -139,8 +274,13 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         self.conf = fs_conf.FusionStorageConf(self.configuration, self.host)
         self.client = None
         self.fs_qos = None
+        self.pool_catalogue = None
+        self.status_poller = None
+        self.hydration_queue = None
+        self.job_scheduler = None
+        self.stats_collector = None
+        self.template_manager = None
         self.manager_groups = self.configuration.iscsi_manager_groups
-        self.lock = Lock()
 
     @staticmethod
     def get_driver_options():
@@ -162,18 +302,55 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
 
         extend_conf = {
             "mutual_authentication": mutual_authentication,
-            "rest_timeout": self.configuration.rest_timeout
+            "rest_timeout": self.configuration.rest_timeout,
+            "page_fetch_workers": self.configuration.page_fetch_concurrency,
+            "topology_cache_ttl": self.configuration.array_topology_cache_ttl,
+            "portal_cache_ttl": self.configuration.iscsi_portal_cache_ttl,
+            "session_count_interval":
+                self.configuration.iscsi_session_count_interval,
+            "delete_batch_window":
+                self.configuration.volume_delete_batch_window,
+            "cluster_facts_ttl": self.configuration.cluster_facts_cache_ttl
         }
 
         self.client = fs_client.RestCommon(fs_address=url_str,
                                            fs_user=url_user,
                                            fs_password=url_password,
                                            **extend_conf)
+        self._check_poll_schedules()
         self.client.login()
-        self.fs_qos = fs_qos.FusionStorageQoS(self.client)
+        self.pool_catalogue = fs_cache.StoragePoolCatalogue(
+            self.client, self.configuration.storage_pool_cache_ttl)
+        self.pool_catalogue.start()
+        self.status_poller = fs_poller.StatusPoller(self.client)
+        self.hydration_queue = fs_jobs.PoolJobQueue(
+            self.configuration.full_clone_pool_concurrency)
+        self.job_scheduler = fs_jobs.JobScheduler(
+            self.configuration.heavy_jobs_per_pool,
+            self.configuration.heavy_job_wait_timeout,
+            self.configuration.heavy_job_load_smoothing)
+        self.fs_qos = fs_qos.FusionStorageQoS(
+            self.client, self.pool_catalogue,
+            shared=self.configuration.qos_policy_shared)
+        self.template_manager = fs_template.TemplateManager(
+            self.client, self.configuration.quickstart_max_link_num,
+            self.configuration.quickstart_delete_master,
+            self.configuration.quickstart_high_water)
+        if self.configuration.quickstart_enabled:
+            self.template_manager.start(
+                self.configuration.quickstart_refill_interval)
+        self.stats_collector = fs_cache.StatsCollector(
+            self._collect_volume_stats,
+            self.configuration.stats_collect_interval,
+            self.configuration.stats_max_age)
+        self.stats_collector.start()
+        volumes = objects.VolumeList.get_all_by_host(context, self.host)
+        self._resume_hydrations(volumes)
+        self._rebuild_template_links(volumes)
+        self._rebuild_qos_refs(volumes)
 
     def check_for_setup_error(self):
-        all_pools = self.client.query_storage_pool_info()
+        all_pools = self.pool_catalogue.get_pools(force_refresh=True)
         all_pools_name = [p['poolName'] for p in all_pools if p.get('poolName')]
 
         for pool in self.configuration.pools_name:
@@ -192,7 +369,7 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             "pools": [],
             "vendor_name": "Huawei"
         }
-        all_pools = self.client.query_storage_pool_info()
+        all_pools = self.pool_catalogue.get_pools(force_refresh=True)
 
         for pool in all_pools:
             if pool['poolName'] in self.configuration.pools_name:
@@ -230,11 +407,22 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             "reserved_percentage": self.configuration.safe_get('reserved_percentage'),
             "support_extend_with_snapshot": True,
         })
+        pool_id = pool_info.get('poolId')
+        status.update(self.job_scheduler.get_stats(pool_id))
+        status['heavy_job_load'] = round(
+            self.job_scheduler.sample_load(pool_id), 2)
         return status
 
-    def get_volume_stats(self, refresh=False):
+    def _collect_volume_stats(self):
         self.client.keep_alive()
-        stats = self._update_pool_stats()
+        self.client.retry_failed_deletes()
+        return self._update_pool_stats()
+
+    def get_volume_stats(self, refresh=False):
+        stats, sample_age = self.stats_collector.get()
+        stats['stats_sample_age'] = int(sample_age)
+        stats['poll_metrics'] = self.status_poller.get_metrics()
+        stats['failed_volume_deletes'] = len(self.client.failed_deletes)
         return stats
 
     def _check_volume_exist(self, volume):
@@ -267,13 +455,11 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         return pool_id
 
     def _get_pool_id_by_name(self, pool_name):
-        pool_id_list = []
-        all_pools = self.client.query_storage_pool_info()
-        for pool in all_pools:
-            if pool_name == pool['poolName']:
-                pool_id_list.append(pool['poolId'])
-            if pool_name.isdigit() and int(pool_name) == int(pool['poolId']):
-                pool_id_list.append(pool['poolId'])
+        pool_id_list = self.pool_catalogue.get_pool_ids(pool_name)
+        if not pool_id_list:
+            # The pool may have been created after the last refresh.
+            self.pool_catalogue.refresh()
+            pool_id_list = self.pool_catalogue.get_pool_ids(pool_name)
 
         if not pool_id_list:
             msg = _('Storage pool %(pool)s does not exist on the array. '
@@ -314,7 +500,8 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         try:
             opts = fs_utils.get_volume_params(volume, self.client)
             if opts.get("qos"):
-                self.fs_qos.add(opts["qos"], vol_name)
+                self.fs_qos.add(opts["qos"], vol_name,
+                                opts.get(constants.QOS_SPECS))
         except Exception:
             self.client.delete_volume(vol_name=vol_name)
             raise
@@ -327,6 +514,7 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             return {"metadata": metadata}
         return {}
 
+    @fs_utils.request_scoped
     def create_volume(self, volume):
         pool_id = self._get_pool_id(volume)
         vol_name = volume.name
@@ -339,14 +527,23 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         result = self.client.query_volume_by_name(vol_name=vol_name)
         return self._set_volume_lun_wwn(result, volume)
 
+    @fs_utils.request_scoped
     def delete_volume(self, volume):
         vol_name = self._get_vol_name(volume)
+        self._cancel_hydration(volume, vol_name)
         if self._check_volume_exist(volume):
             self._check_volume_mapped(vol_name)
             self.fs_qos.remove(vol_name)
-            self.client.delete_volume(vol_name=vol_name)
-
+            self.client.delete_volume(
+                vol_name=vol_name,
+                wait=not self.configuration.volume_delete_async)
+        __, master_name = self._get_master_info(volume)
+        if master_name:
+            self.template_manager.release_link(master_name)
+
+    @fs_utils.request_scoped
     def extend_volume(self, volume, new_size):
+        self._check_volume_hydrated(volume)
         vol_name = self._get_vol_name(volume)
         if not self._check_volume_exist(volume):
             msg = _("Volume: %(vol_name)s does not exist!"
@@ -359,8 +556,8 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
     def _check_snapshot_exist(self, volume, snapshot):
         pool_id = self._get_pool_id(volume)
         snapshot_name = self._get_snapshot_name(snapshot)
-        result = self.client.query_snapshot_by_name(
-            pool_id=pool_id, snapshot_name=snapshot_name)
+        result = self.client.get_snapshot_by_name(
+            pool_id=pool_id, snapshot_name=snapshot_name, cached=False)
         return result if result else None
 
     def _get_snapshot_name(self, snapshot):
@@ -390,54 +587,253 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             self.client.delete_volume(vol_name=vol_name)
             raise
 
-    def _check_create_cloned_volume_finish(self, new_volume_name, start_time):
-        LOG.debug('Loopcall: _check_create_cloned_volume_finish(), '
-                  'volume-name %s',
-                  new_volume_name)
-        current_volume = self.client.query_volume_by_name(new_volume_name)
-
-        if current_volume and 'status' in current_volume:
-            status = int(current_volume['status'])
-            LOG.debug('Wait clone volume %(volume_name)s, status:%(status)s.',
-                      {"volume_name": new_volume_name,
-                       "status": status})
-            if status in {constants.REST_VOLUME_CREATING_STATUS,
-                          constants.REST_VOLUME_DUPLICATE_VOLUME}:
-                LOG.debug(_("Volume %s is cloning"), new_volume_name)
-            elif status == constants.REST_VOLUME_CREATE_SUCCESS_STATUS:
-                raise loopingcall.LoopingCallDone(retvalue=True)
-            else:
-                msg = _('Clone volume %(new_volume_name)s failed, '
-                        'the status is:%(status)s.')
-                LOG.error(msg, {'new_volume_name': new_volume_name,
-                                'status': status})
-                raise loopingcall.LoopingCallDone(retvalue=False)
-
-            max_time_out = constants.CLONE_VOLUME_TIMEOUT
-            current_time = time.time()
-            if (current_time - start_time) > max_time_out:
-                msg = _('Dsware clone volume time out. '
-                        'Volume: %(new_volume_name)s, status: %(status)s')
-                LOG.error(msg, {'new_volume_name': new_volume_name,
-                                'status': current_volume['status']})
-                raise loopingcall.LoopingCallDone(retvalue=False)
-        else:
-            LOG.warning(_('Can not find volume %s'), new_volume_name)
-            msg = "DSWARE clone volume failed:volume can not find from dsware"
-            LOG.error(msg)
-            raise loopingcall.LoopingCallDone(retvalue=False)
-
-    def _wait_for_create_cloned_volume_finish_timer(self, new_volume_name):
-        timer = loopingcall.FixedIntervalLoopingCall(
-            self._check_create_cloned_volume_finish,
-            new_volume_name, time.time())
-        LOG.debug('Calling _check_create_cloned_volume_finish: volume-name %s',
-                  new_volume_name)
-        ret = timer.start(interval=constants.CHECK_CLONED_INTERVAL).wait()
-        timer.stop()
-        return ret
+    def _is_cloned_volume_created(self, new_volume_name, current_volume):
+        if not current_volume or 'status' not in current_volume:
+            msg = _("DSWARE clone volume failed: volume %s can not find from "
+                    "dsware") % new_volume_name
+            self._raise_exception(msg)
 
+        status = int(current_volume['status'])
+        LOG.debug('Wait clone volume %(volume_name)s, status:%(status)s.',
+                  {"volume_name": new_volume_name,
+                   "status": status})
+        if status in {constants.REST_VOLUME_CREATING_STATUS,
+                      constants.REST_VOLUME_DUPLICATE_VOLUME}:
+            LOG.debug("Volume %s is cloning", new_volume_name)
+            return False
+        if status == constants.REST_VOLUME_CREATE_SUCCESS_STATUS:
+            return True
+
+        msg = (_('Clone volume %(new_volume_name)s failed, '
+                 'the status is:%(status)s.')
+               % {'new_volume_name': new_volume_name, 'status': status})
+        self._raise_exception(msg)
+
+    def _wait_for_create_cloned_volume_finish(self, new_volume_name,
+                                              pool_id=None):
+        LOG.debug('Wait for cloned volume %s to be created.', new_volume_name)
+        try:
+            self.status_poller.watch_volume(
+                new_volume_name, pool_id,
+                lambda vol_info: self._is_cloned_volume_created(
+                    new_volume_name, vol_info),
+                self._create_poll_schedule(constants.POLL_OP_CLONE,
+                                           constants.CHECK_CLONED_INTERVAL),
+                constants.CLONE_VOLUME_TIMEOUT,
+                op_type=constants.POLL_OP_CLONE).wait()
+        except exception.VolumeBackendAPIException as err:
+            LOG.error("Wait for cloned volume %(vol)s failed. Reason: "
+                      "%(err)s", {"vol": new_volume_name, "err": err})
+            return False
+        return True
+
+    def _create_full_volume_from_snapshot(self, vol_name, pool_id,
+                                          snapshot_name,
+                                          job_type=constants.JOB_FULL_CLONE,
+                                          copy_started=False,
+                                          on_copy_started=None):
+        """Copy the snapshot to the volume and wait for the copy to finish.
+
+        The copy is admitted by the job scheduler of the pool first,
+        on_copy_started is called once the array has accepted the copy.
+        Return whether the copy succeeded.
+        """
+        with self.job_scheduler.admit(pool_id, job_type, vol_name):
+            if not copy_started:
+                self.client.create_full_volume_from_snapshot(vol_name,
+                                                             snapshot_name)
+                if on_copy_started:
+                    on_copy_started()
+            return self._wait_for_create_cloned_volume_finish(
+                vol_name, pool_id)
+
+    @staticmethod
+    def _new_hydration(snapshot_name, temp_snapshot):
+        """Return the provider_location keys that track the copy.
+
+        The copy state is kept in the provider_location of the volume,
+        which only the driver writes.
+        """
+        return {
+            constants.HYDRATION_STATUS_KEY: constants.HYDRATION_QUEUED,
+            constants.HYDRATION_SOURCE_KEY: snapshot_name,
+            constants.HYDRATION_TEMP_SNAPSHOT_KEY: (
+                'true' if temp_snapshot else 'false'),
+        }
+
+    def _queue_hydration(self, volume_id, vol_name, pool_id, hydration):
+        """Copy the snapshot to the volume in the background.
+
+        The volume must be complete otherwise, the job only copies the data
+        and updates the hydration state in the database when the copy
+        starts and finishes.
+        """
+        snapshot_name = hydration.get(constants.HYDRATION_SOURCE_KEY)
+        self.hydration_queue.submit(
+            pool_id, vol_name,
+            functools.partial(
+                self._hydrate_volume, volume_id, vol_name, pool_id,
+                snapshot_name,
+                hydration.get(constants.HYDRATION_TEMP_SNAPSHOT_KEY) == 'true',
+                hydration.get(constants.HYDRATION_STATUS_KEY) ==
+                constants.HYDRATION_COPYING),
+            resources=(vol_name, snapshot_name))
+
+    @staticmethod
+    def _add_hydration_state(model_update, vol_name, hydration):
+        if hydration:
+            provider_location = {"name": vol_name}
+            provider_location.update(hydration)
+            model_update['provider_location'] = json.dumps(provider_location)
+        return model_update
+
+    def _wait_volume_created_in_db(self, volume_id):
+        # The volume manager saves the provider_location returned by the
+        # create call when the volume leaves the creating status, do not
+        # overwrite it.
+        self.status_poller.watch(
+            lambda: fs_utils.get_volume_by_id(volume_id).status,
+            self._create_poll_schedule(constants.POLL_OP_DEFAULT,
+                                       constants.CHECK_CLONED_INTERVAL),
+            constants.HYDRATION_START_TIMEOUT,
+            predicate=lambda status: status != 'creating',
+            name=volume_id).wait()
+
+    def _hydrate_volume(self, volume_id, vol_name, pool_id, snapshot_name,
+                        temp_snapshot, copy_started):
+        status = constants.HYDRATION_FAILED
+        cancelled = False
+        try:
+            self._wait_volume_created_in_db(volume_id)
+            cancelled = not self.hydration_queue.start(vol_name)
+            # A copy resumed after a restart is only issued again when the
+            # array had not accepted it.
+            if not cancelled and self._create_full_volume_from_snapshot(
+                    vol_name, pool_id, snapshot_name,
+                    job_type=constants.JOB_HYDRATION,
+                    copy_started=copy_started,
+                    on_copy_started=lambda: fs_utils.update_provider_location(
+                        volume_id, {constants.HYDRATION_STATUS_KEY:
+                                    constants.HYDRATION_COPYING})):
+                status = constants.HYDRATION_DONE
+        except Exception as err:
+            LOG.error("Hydrate volume %(vol)s from snapshot %(snap)s failed. "
+                      "Reason: %(err)s",
+                      {"vol": vol_name, "snap": snapshot_name, "err": err})
+        finally:
+            # A cancelled copy leaves the snapshot to the canceller.
+            if temp_snapshot and not cancelled:
+                try:
+                    self.client.delete_snapshot(snapshot_name)
+                except Exception as err:
+                    LOG.warning("Delete temp snapshot %(snap)s failed. "
+                                "Reason: %(err)s",
+                                {"snap": snapshot_name, "err": err})
+
+        if cancelled:
+            LOG.info("Hydration of volume %s is cancelled.", vol_name)
+            return
+        LOG.info("Hydrate volume %(vol)s finished, status: %(status)s.",
+                 {"vol": vol_name, "status": status})
+        # A volume that misses part of its data can only be deleted.
+        fs_utils.update_provider_location(
+            volume_id, {constants.HYDRATION_STATUS_KEY: status},
+            status='error' if status == constants.HYDRATION_FAILED else None)
+
+    def _resume_hydration(self, volume):
+        hydration = fs_utils.get_provider_location(volume)
+        status = hydration.get(constants.HYDRATION_STATUS_KEY)
+        if status not in (constants.HYDRATION_QUEUED,
+                          constants.HYDRATION_COPYING):
+            return
+
+        vol_name = self._get_vol_name(volume)
+        if self.hydration_queue.is_queued(vol_name):
+            return
+        LOG.info("Resume hydration of volume %s.", vol_name)
+        self._queue_hydration(
+            volume.id, vol_name, self._get_pool_id(volume), hydration)
+
+    def _resume_hydrations(self, volumes):
+        """Queue again the copies that a restart of the service stopped."""
+        for volume in volumes:
+            try:
+                self._resume_hydration(volume)
+            except Exception as err:
+                LOG.warning("Resume hydration of volume %(vol)s failed. "
+                            "Reason: %(err)s", {"vol": volume.id, "err": err})
+
+    def _cancel_hydration(self, volume, vol_name):
+        if self.hydration_queue.is_running(vol_name):
+            raise exception.VolumeIsBusy(volume_name=vol_name)
+        if not self.hydration_queue.cancel(vol_name):
+            return
+
+        hydration = fs_utils.get_provider_location(volume)
+        if hydration.get(constants.HYDRATION_TEMP_SNAPSHOT_KEY) == 'true':
+            self.client.delete_snapshot(
+                hydration.get(constants.HYDRATION_SOURCE_KEY))
+
+    def _check_volume_hydrated(self, volume):
+        hydration = fs_utils.get_provider_location(volume)
+        status = hydration.get(constants.HYDRATION_STATUS_KEY)
+        if status in (constants.HYDRATION_QUEUED,
+                      constants.HYDRATION_COPYING):
+            LOG.error("Volume %s is still being copied from its source.",
+                      volume.id)
+            raise exception.VolumeIsBusy(volume_name=volume.name)
+        if status == constants.HYDRATION_FAILED:
+            msg = _("Volume %s was not completely copied from its source, "
+                    "it can only be deleted.") % volume.id
+            self._raise_exception(msg)
+
+    def _create_linked_volume_from_snapshot(self, volume, snapshot):
+        """Create the volume first, check the snapshot and volume on failure.
+
+        The existence checks are only needed to explain a failed create.
+        The expand check is skipped when the volume is as large as the
+        snapshot, so the volume info is read once, for the WWN.
+        """
+        vol_name = self._get_vol_name(volume)
+        snapshot_name = self._get_snapshot_name(snapshot)
+        vol_size = volume.size * units.Ki
+
+        try:
+            self.client.create_volume_from_snapshot(
+                snapshot_name=snapshot_name, vol_name=vol_name,
+                vol_size=vol_size)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if not self._check_snapshot_exist(snapshot.volume, snapshot):
+                    msg = _("Snapshot: %(name)s does not exist!"
+                            ) % {"name": snapshot_name}
+                    self._raise_exception(msg)
+                if self._check_volume_exist(volume):
+                    msg = _("Volume: %(vol_name)s already exists!"
+                            ) % {'vol_name': vol_name}
+                    self._raise_exception(msg)
+
+        self._add_qos_to_volume(volume, vol_name)
+        # The snapshots made for a group clone carry no volume_size.
+        if volume.size != snapshot.get('volume_size', None):
+            self._expand_volume_when_create(vol_name, vol_size)
+        result = self.client.query_volume_by_name(vol_name=vol_name)
+        return self._set_volume_lun_wwn(result, volume)
+
+    @fs_utils.request_scoped
     def create_volume_from_snapshot(self, volume, snapshot):
+        return self._create_volume_from_snapshot(volume, snapshot)
+
+    def _create_volume_from_snapshot(self, volume, snapshot,
+                                     temp_snapshot=False):
+        """Create a volume from a snapshot.
+
+        temp_snapshot tells that the snapshot was made for this volume only,
+        an asynchronous copy deletes it once it is done.
+        """
+        if not self.configuration.full_clone:
+            return self._create_linked_volume_from_snapshot(volume, snapshot)
+
         vol_name = self._get_vol_name(volume)
         snapshot_name = self._get_snapshot_name(snapshot)
         vol_size = volume.size
@@ -453,25 +849,26 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             self._raise_exception(msg)
 
         vol_size *= units.Ki
-        if not self.configuration.full_clone:
-            self.client.create_volume_from_snapshot(
-                snapshot_name=snapshot_name, vol_name=vol_name,
-                vol_size=vol_size)
+        hydration = None
+        self.client.create_volume(vol_name, vol_size, pool_id)
+        if self.configuration.full_clone_async:
+            hydration = self._new_hydration(snapshot_name, temp_snapshot)
         else:
-            self.client.create_volume(vol_name, vol_size, pool_id)
-            self.client.create_full_volume_from_snapshot(vol_name,
-                                                         snapshot_name)
-            ret = self._wait_for_create_cloned_volume_finish_timer(vol_name)
+            ret = self._create_full_volume_from_snapshot(
+                vol_name, pool_id, snapshot_name)
             if not ret:
                 msg = _('Create full volume %s from snap failed') % vol_name
                 self._raise_exception(msg)
         self._add_qos_to_volume(volume, vol_name)
         self._expand_volume_when_create(vol_name, vol_size)
         result = self.client.query_volume_by_name(vol_name=vol_name)
-        return self._set_volume_lun_wwn(result, volume)
+        if hydration:
+            self._queue_hydration(volume.id, vol_name, pool_id, hydration)
+        return self._add_hydration_state(
+            self._set_volume_lun_wwn(result, volume), vol_name, hydration)
 
     def _create_volume_from_volume_full_clone(self, vol_name, vol_size, pool_id,
-                                              src_vol_name):
+                                              src_vol_name, volume_id=None):
         tmp_snap_name = "temp" + src_vol_name + "clone" + vol_name
 
         self.client.create_snapshot(tmp_snap_name, src_vol_name)
@@ -481,21 +878,25 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             self.client.delete_snapshot(tmp_snap_name)
             raise err
 
+        if volume_id and self.configuration.full_clone_async:
+            return self._new_hydration(tmp_snap_name, True)
+
         try:
-            self.client.create_full_volume_from_snapshot(
-                vol_name, tmp_snap_name)
+            ret = self._create_full_volume_from_snapshot(
+                vol_name, pool_id, tmp_snap_name)
         except Exception as err:
             self.client.delete_snapshot(tmp_snap_name)
             self.client.delete_volume(vol_name)
             raise err
 
-        ret = self._wait_for_create_cloned_volume_finish_timer(vol_name)
         if not ret:
             msg = _('Create full volume %s from snap failed') % vol_name
             self._raise_exception(msg)
         self.client.delete_snapshot(tmp_snap_name)
 
+    @fs_utils.request_scoped
     def create_cloned_volume(self, volume, src_volume):
+        self._check_volume_hydrated(src_volume)
         vol_name = self._get_vol_name(volume)
         src_vol_name = self._get_vol_name(src_volume)
 
@@ -507,22 +908,33 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                     ) % {"vol_name": src_vol_name}
             self._raise_exception(msg)
 
+        hydration = None
         if not self.configuration.full_clone:
             self.client.create_volume_from_volume(
                 vol_name=vol_name, vol_size=vol_size,
                 src_vol_name=src_vol_name)
         else:
             pool_id = self._get_pool_id(volume)
-            self._create_volume_from_volume_full_clone(
+            hydration = self._create_volume_from_volume_full_clone(
                 vol_name=vol_name, vol_size=vol_size, pool_id=pool_id,
-                src_vol_name=src_vol_name)
+                src_vol_name=src_vol_name, volume_id=volume.id)
 
-        self._add_qos_to_volume(volume, vol_name)
-        self._expand_volume_when_create(vol_name, vol_size)
+        try:
+            self._add_qos_to_volume(volume, vol_name)
+            self._expand_volume_when_create(vol_name, vol_size)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if hydration:
+                    self.client.delete_snapshot(
+                        hydration[constants.HYDRATION_SOURCE_KEY])
         result = self.client.query_volume_by_name(vol_name=vol_name)
-        return self._set_volume_lun_wwn(result, volume)
+        if hydration:
+            self._queue_hydration(volume.id, vol_name, pool_id, hydration)
+        return self._add_hydration_state(
+            self._set_volume_lun_wwn(result, volume), vol_name, hydration)
 
     def create_snapshot(self, snapshot):
+        self._check_volume_hydrated(snapshot.volume)
         snapshot_name = self._get_snapshot_name(snapshot)
         vol_name = self._get_vol_name(snapshot.volume)
 
@@ -531,6 +943,8 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
 
     def delete_snapshot(self, snapshot):
         snapshot_name = self._get_snapshot_name(snapshot)
+        if self.hydration_queue.is_busy(snapshot_name):
+            raise exception.SnapshotIsBusy(snapshot_name=snapshot_name)
 
         if self._check_snapshot_exist(snapshot.volume, snapshot):
             self.client.delete_snapshot(snapshot_name=snapshot_name)
@@ -540,11 +954,7 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             return self.client.query_volume_by_name(vol_name)
 
         elif vol_id:
-            try:
-                return self.client.query_volume_by_id(vol_id)
-            except Exception:
-                LOG.warning("Query volume info by id failed!")
-                return self.client.get_volume_by_id(pool_id, vol_id)
+            return self.client.get_volume_by_id(pool_id, vol_id)
         return None
 
     def _get_volume_info(self, pool_id, existing_ref):
@@ -581,6 +991,7 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                 self._raise_exception(msg)
         elif new_opts.get(constants.QOS):
             new_qos[constants.QOS] = new_opts.get(constants.QOS)
+            new_qos[constants.QOS_SPECS] = new_opts.get(constants.QOS_SPECS)
             old_qos[constants.QOS] = {}
 
         change_opts = {"old_opts": old_qos, "new_opts": new_qos}
@@ -593,11 +1004,13 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
 
     def _change_qos_add(self, vol_name, new_opts, old_opts):
         if not old_opts.get("qos") and new_opts.get("qos"):
-            self.fs_qos.add(new_opts["qos"], vol_name)
+            self.fs_qos.add(new_opts["qos"], vol_name,
+                            new_opts.get(constants.QOS_SPECS))
 
     def _change_qos_update(self, vol_name, new_opts, old_opts):
         if old_opts.get("qos") and new_opts.get("qos"):
-            self.fs_qos.update(new_opts["qos"], vol_name)
+            self.fs_qos.update(new_opts["qos"], vol_name,
+                               specs=new_opts.get(constants.QOS_SPECS))
 
     def _change_lun(self, vol_name, new_opts, old_opts):
         def _change_qos():
@@ -708,6 +1121,8 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         if old_opts.get(constants.QOS) != new_opts.get(constants.QOS):
             before_change[constants.QOS] = old_opts.get(constants.QOS)
             after_change[constants.QOS] = new_opts.get(constants.QOS)
+            after_change[constants.QOS_SPECS] = new_opts.get(
+                constants.QOS_SPECS)
 
         change_opts = {
             "old_opts": before_change,
@@ -723,6 +1138,7 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                   "diff": diff,
                   "host": host})
 
+        self._check_volume_hydrated(volume)
         vol_name = self._get_vol_name(volume)
         migrate, change_opts = self._check_need_changes_for_retype(
             volume, new_type, host, vol_name)
@@ -742,20 +1158,20 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
 
         return True, None
 
+    @fs_utils.request_scoped
     def migrate_volume(self, context, volume, host):
         """Migrate a volume within the same array."""
         LOG.info("Migrate Volume:%(volume)s, host:%(host)s",
                  {"volume": volume.id,
                   "host": host})
+        self._check_volume_hydrated(volume)
         src_lun_id = self._check_volume_exist_on_array(volume)
         self._check_volume_snapshot_exist(volume)
 
         moved = self._migrate_volume(volume, host, src_lun_id)
         return moved, {}
 
-    def _create_dst_volume(self, volume, host):
-        pool_name = host['capabilities']['pool_name']
-        pool_id = self._get_pool_id_by_name(pool_name)
+    def _create_dst_volume(self, volume, pool_id):
         vol_name = fs_utils.encode_name(six.text_type(uuid.uuid4()))
         vol_size = volume.size
         vol_size *= units.Ki
@@ -772,19 +1188,32 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         if not self._check_migration_valid(host):
             return False
 
-        vol_name, dst_lun_id = self._create_dst_volume(volume, host)
+        pool_id = self._get_pool_id_by_name(host['capabilities']['pool_name'])
+        vol_name, dst_lun_id = self._create_dst_volume(volume, pool_id)
         LOG.debug("Begin migrate volume, volume name:%s, dst lun id:%s. ", vol_name, dst_lun_id)
 
         try:
-            self.client.create_lun_migration(src_lun_id, dst_lun_id)
-
-            def _is_lun_migration_complete():
-                return self._is_lun_migration_complete(src_lun_id, dst_lun_id)
-
-            wait_interval = constants.MIGRATION_WAIT_INTERVAL
-            fs_utils.wait_for_condition(_is_lun_migration_complete,
-                                        wait_interval,
-                                        constants.DEFAULT_WAIT_TIMEOUT)
+            with self.job_scheduler.admit(
+                    pool_id, constants.JOB_MIGRATION, vol_name):
+                self.client.create_lun_migration(
+                    src_lun_id, dst_lun_id,
+                    speed=self._get_migration_speed(pool_id))
+
+                def _is_lun_migration_complete(result):
+                    return self._is_lun_migration_complete(
+                        src_lun_id, dst_lun_id, result)
+
+                wait_interval = constants.MIGRATION_WAIT_INTERVAL
+                self.status_poller.watch(
+                    lambda: self.client.get_lun_migration_task_by_id(
+                        src_lun_id),
+                    self._create_poll_schedule(constants.POLL_OP_MIGRATION,
+                                               wait_interval),
+                    constants.DEFAULT_WAIT_TIMEOUT,
+                    predicate=_is_lun_migration_complete,
+                    op_type=constants.POLL_OP_MIGRATION,
+                    progress=lambda result: (result or {}).get('progress'),
+                    name=vol_name).wait()
         # Clean up if migration failed.
         except Exception as ex:
             raise exception.VolumeBackendAPIException(data=ex)
@@ -802,8 +1231,8 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             # need to remove qos, Delete the LUN directly.
             self.client.delete_volume(vol_name)
 
-    def _is_lun_migration_complete(self, src_lun_id, dst_lun_id):
-        result = self.client.get_lun_migration_task_by_id(src_lun_id)
+    @staticmethod
+    def _is_lun_migration_complete(src_lun_id, dst_lun_id, result):
         found_migration_task = False
         if not result:
             return False
@@ -851,9 +1280,62 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                 return True
             return False
 
-        fs_utils.wait_for_condition(_volume_ready,
-                                    wait_interval,
-                                    wait_interval * 10)
+        self.status_poller.watch(
+            _volume_ready,
+            self._create_poll_schedule(constants.POLL_OP_VOLUME_READY,
+                                       wait_interval),
+            wait_interval * 10,
+            op_type=constants.POLL_OP_VOLUME_READY,
+            name=vol_name).wait()
+
+    def _check_poll_schedules(self):
+        for op_type, kind in self.configuration.poll_schedules.items():
+            if op_type not in constants.DEFAULT_POLL_SCHEDULES:
+                msg = _('Invalid operation type %(type)s in poll_schedules, '
+                        'the valid types are %(valid)s.'
+                        ) % {'type': op_type,
+                             'valid': sorted(constants.DEFAULT_POLL_SCHEDULES)}
+                LOG.error(msg)
+                raise exception.InvalidInput(reason=msg)
+            if kind not in constants.POLL_SCHEDULE_KINDS:
+                msg = _('Invalid schedule %(kind)s for %(type)s in '
+                        'poll_schedules, the valid schedules are %(valid)s.'
+                        ) % {'kind': kind, 'type': op_type,
+                             'valid': list(constants.POLL_SCHEDULE_KINDS)}
+                LOG.error(msg)
+                raise exception.InvalidInput(reason=msg)
+
+    def _create_poll_schedule(self, op_type, interval):
+        kind = self.configuration.poll_schedules.get(
+            op_type, constants.DEFAULT_POLL_SCHEDULES.get(op_type))
+        return fs_poller.create_schedule(kind, interval)
+
+    def _get_migration_speed(self, pool_id):
+        """Choose the migration speed from the load of the target pool.
+
+        The pool info reports capacity but no bandwidth, so the load is
+        judged from the heavy jobs running in the pool and its used
+        capacity ratio.
+        """
+        running, queued = self.job_scheduler.get_load(pool_id)
+        occupancy = float(running) / self.job_scheduler.per_pool_limit
+        pool_info = self.pool_catalogue.get_pool_by_id(pool_id) or {}
+        total = float(pool_info.get('totalCapacity') or 0)
+        usage = (float(pool_info.get('usedCapacity') or 0) / total
+                 if total else 0)
+
+        if queued or occupancy >= 1 or usage >= constants.POOL_BUSY_USAGE:
+            speed = constants.MIGRATION_SPEED_LOW
+        elif occupancy <= 0.5:
+            speed = constants.MIGRATION_SPEED_HIGH
+        else:
+            speed = constants.MIGRATION_SPEED_MEDIUM
+        LOG.info("Migration speed of pool %(pool)s is %(speed)s, running "
+                 "jobs: %(run)s, queued jobs: %(queue)s, used ratio: "
+                 "%(usage).2f.", {"pool": pool_id, "speed": speed,
+                                  "run": running, "queue": queued,
+                                  "usage": usage})
+        return speed
 
     def _check_migration_valid(self, host):
         if 'pool_name' not in host.get('capabilities', {}):
@@ -900,9 +1382,8 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                     ) % volume.id
             self._raise_exception(msg)
 
-    def _rollback_snapshot(self, vol_name, snap_name):
-        def _snapshot_rollback_finish():
-            snapshot_info = self.client.get_snapshot_info_by_name(snap_name)
+    def _rollback_snapshot(self, vol_name, snap_name, pool_id):
+        def _snapshot_rollback_finish(snapshot_info):
             if not snapshot_info:
                 msg = (_("Failed to get rollback info with snapshot %s.")
                        % snap_name)
@@ -920,18 +1401,28 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                 return True
             return False
 
-        if fs_utils.is_snapshot_rollback_available(self.client, snap_name):
-            self.client.rollback_snapshot(vol_name, snap_name)
-
-        try:
-            fs_utils.wait_for_condition(
-                _snapshot_rollback_finish, constants.WAIT_INTERVAL,
-                constants.SNAPSHOT_ROLLBACK_TIMEOUT)
-        except exception.VolumeBackendAPIException:
-            self.client.cancel_rollback_snapshot(snap_name)
-            raise
+        with self.job_scheduler.admit(
+                pool_id, constants.JOB_ROLLBACK, snap_name):
+            if fs_utils.is_snapshot_rollback_available(self.client, snap_name):
+                self.client.rollback_snapshot(vol_name, snap_name)
 
+            try:
+                self.status_poller.watch(
+                    lambda: self.client.get_snapshot_info_by_name(snap_name),
+                    self._create_poll_schedule(constants.POLL_OP_ROLLBACK,
+                                               constants.WAIT_INTERVAL),
+                    constants.SNAPSHOT_ROLLBACK_TIMEOUT,
+                    predicate=_snapshot_rollback_finish,
+                    op_type=constants.POLL_OP_ROLLBACK,
+                    progress=lambda info: info.get('rollback_progress'),
+                    name=snap_name).wait()
+            except exception.VolumeBackendAPIException:
+                self.client.cancel_rollback_snapshot(snap_name)
+                raise
+
+    @fs_utils.request_scoped
     def revert_to_snapshot(self, context, volume, snapshot):
+        self._check_volume_hydrated(volume)
         vol_name = self._get_vol_name(volume)
         snap_name = self._get_snapshot_name(snapshot)
         if not self._check_snapshot_exist(snapshot.volume, snapshot):
@@ -944,7 +1435,7 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
                     ) % {'vol_name': vol_name}
             self._raise_exception(msg)
 
-        self._rollback_snapshot(vol_name, snap_name)
+        self._rollback_snapshot(vol_name, snap_name, self._get_pool_id(volume))
 
     def create_export(self, context, volume, connector):
         pass
@@ -993,12 +1484,18 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         """
         if add_volumes is None:
             add_volumes = []
-        for volume in add_volumes:
-            try:
-                self._check_volume_exist_on_array(volume)
-            except Exception:
-                with excutils.save_and_reraise_exception():
-                    LOG.error("The add_volume %s not exist on array" % volume.id)
+        results = self._run_group_tasks(
+            self._check_volume_exist_on_array, add_volumes)
+        missing_volumes = []
+        for volume, __, err in results:
+            if err is not None:
+                LOG.error("The add_volume %(vol)s not exist on array. "
+                          "Reason: %(err)s", {"vol": volume.id, "err": err})
+                missing_volumes.append(volume.id)
+        if missing_volumes:
+            msg = _("Volumes %s can not be added to the group.") % ", ".join(
+                missing_volumes)
+            self._raise_exception(msg)
 
         model_update = {'status': 'available'}
         LOG.info("Update group successfully")
@@ -1017,19 +1514,20 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
         """delete the group, Driver need to delete relation lun on array"""
         volumes_model_update = []
         model_update = {'status': 'deleted'}
-        for volume in volumes:
+        for volume, __, err in self._run_group_tasks(
+                self.delete_volume, volumes):
             volume_model_update = {'id': volume.id}
-            try:
-                self.delete_volume(volume)
-            except Exception:
-                LOG.error('Delete volume %s failed.' % volume)
+            if err is not None:
+                LOG.error('Delete volume %s failed. Reason: %s' % (volume, err))
                 volume_model_update.update({'status': 'error_deleting'})
             else:
+                LOG.info('Deleted volume %s successfully' % volume)
                 volume_model_update.update({'status': 'deleted'})
-
-            LOG.info('Deleted volume %s successfully' % volume)
             volumes_model_update.append(volume_model_update)
 
+        if any(update['status'] == 'error_deleting'
+               for update in volumes_model_update):
+            model_update['status'] = 'error_deleting'
         LOG.info("Delete group successfully")
         return model_update, volumes_model_update
 
@@ -1079,42 +1577,44 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
 
         if snapshots:
             volumes_model_update = self._create_volume_from_group_snapshot(
-                volumes, snapshots, delete_snapshots)
+                volumes, snapshots, temp_snapshots=delete_snapshots)
 
         if delete_snapshots:
-            self._delete_group_snapshot(snapshots)
-
+            # The copies still running delete their snapshot when done.
+            self._delete_group_snapshot(
+                [snapshot for snapshot in snapshots
+                 if not self.hydration_queue.is_busy(
+                     self._get_snapshot_name(snapshot))])
+
+        if any(update.get('status') == 'error'
+               for update in volumes_model_update):
+            model_update['status'] = 'error'
         LOG.info("Create group from src successfully")
         return model_update, volumes_model_update
 
-    def _create_volume_from_group_snapshot(self, volumes, snapshots, delete_snapshots):
+    def _create_volume_from_group_snapshot(self, volumes, snapshots,
+                                           temp_snapshots=False):
+        def _create_volume(volume_snapshot):
+            volume, snapshot = volume_snapshot
+            vol_model_update = self._create_volume_from_snapshot(
+                volume, snapshot, temp_snapshots)
+            vol_model_update.update({'id': volume.id})
+            return vol_model_update
+
         volumes_model_update = []
-        added_volumes = []
-        for i, volume in enumerate(volumes):
-            try:
-                vol_model_update = self.create_volume_from_snapshot(
-                    volume, snapshots[i])
-                vol_model_update.update({'id': volume.id})
-                volumes_model_update.append(vol_model_update)
-                added_volumes.append(volume)
-            except Exception:
-                LOG.error("Create volume from snapshot error, Delete the newly created lun.")
-                with excutils.save_and_reraise_exception():
-                    self._delete_added_volume_snapshots(
-                        added_volumes, snapshots, delete_snapshots)
+        for (volume, __), vol_model_update, err in self._run_group_tasks(
+                _create_volume, list(zip(volumes, snapshots))):
+            if err is not None:
+                LOG.error("Create volume %(vol)s from snapshot error. "
+                          "Reason: %(err)s", {"vol": volume.id, "err": err})
+                vol_model_update = {'id': volume.id, 'status': 'error'}
+            volumes_model_update.append(vol_model_update)
 
         return volumes_model_update
 
-    def _delete_added_volume_snapshots(
-            self, added_volumes, snapshots, delete_snapshots):
-        if delete_snapshots:
-            self._delete_group_snapshot(snapshots)
-        for add_volume in added_volumes:
-            vol_name = self._get_vol_name(add_volume)
-            self.fs_qos.remove(vol_name)
-            self.client.delete_volume(vol_name=vol_name)
-            LOG.info("delete storage newly added "
-                     "volume success, volume is %s" % add_volume.id)
+    def _run_group_tasks(self, func, items):
+        return fs_utils.run_in_parallel(
+            func, items, self.configuration.group_operation_concurrency)
 
     def create_group_snapshot(self, context, group_snapshot, snapshots):
         """Create group snapshot."""
@@ -1191,29 +1691,173 @@ class DSWAREBaseDriver(customization_driver.DriverForPlatform,
             raise exception.CinderException(msg)
 
         model_update = {'status': 'deleted'}
+        if any(update['status'] == 'error_deleting'
+               for update in snapshots_model_update):
+            model_update['status'] = 'error_deleting'
         return model_update, snapshots_model_update
 
     def _delete_group_snapshot(self, snapshots):
         """Delete all snapshots in snapshot group"""
-        snapshots_model_update = []
-        for snapshot in snapshots:
-            snapshot_model_update = {
-                'id': snapshot.id,
-                'status': 'deleted'
-            }
-            snapshots_model_update.append(snapshot_model_update)
+        def _delete_snapshot(snapshot):
             snapshot_name = self._get_snapshot_name(snapshot)
-
             if not self._check_snapshot_exist(snapshot.volume, snapshot):
                 LOG.info("snapshot %s not exist in array, "
                          "don't need to delete, try next one" % snapshot_name)
-                continue
+                return
             self.client.delete_snapshot(snapshot_name=snapshot_name)
             LOG.info("Delete snapshot successfully,"
                      " the deleted snapshots is %s" % snapshot_name)
 
+        snapshots_model_update = []
+        for snapshot, __, err in self._run_group_tasks(
+                _delete_snapshot, snapshots):
+            snapshot_model_update = {
+                'id': snapshot.id,
+                'status': 'deleted'
+            }
+            if err is not None:
+                LOG.error("Delete snapshot %(snap)s failed. Reason: %(err)s",
+                          {"snap": snapshot.id, "err": err})
+                snapshot_model_update['status'] = 'error_deleting'
+            snapshots_model_update.append(snapshot_model_update)
+
         return snapshots_model_update
 
+    def clone_image(self, context, volume, image_location, image_meta,
+                    image_service):
+        """Create the volume as a linked clone of a master of the image."""
+        if not self.configuration.quickstart_enabled:
+            return None, False
+
+        try:
+            model_update = self._quick_create_volume(
+                context, volume, image_service, image_meta)
+        except Exception as err:
+            LOG.warning("Quick create volume %(vol)s from image %(image)s "
+                        "failed, copy the image instead. Reason: %(err)s",
+                        {"vol": volume.id, "image": image_meta['id'],
+                         "err": err})
+            if self._check_volume_exist(volume):
+                self.client.delete_volume(self._get_vol_name(volume))
+            return None, False
+        return model_update, model_update is not None
+
+    @staticmethod
+    def _get_image_size(image_meta):
+        image_bytes = max(image_meta.get('size') or 0,
+                          image_meta.get('virtual_size') or 0)
+        return max(image_meta.get('min_disk') or 0,
+                   (image_bytes + units.Gi - 1) // units.Gi, 1)
+
+    @staticmethod
+    def _get_master_info(volume):
+        provider_location = volume.get("provider_location", None)
+        if provider_location:
+            try:
+                provider_location = json.loads(provider_location)
+                return (provider_location.get('image_id'),
+                        provider_location.get('master'))
+            except Exception as err:
+                LOG.warning("Get volume provider_location %(loc)s error. "
+                            "Reason: %(err)s",
+                            {"loc": provider_location, "err": err})
+        return None, None
+
+    def _rebuild_template_links(self, volumes):
+        """Count the volumes of each master, the counts are not stored."""
+        for volume in volumes:
+            image_id, master_name = self._get_master_info(volume)
+            if not master_name:
+                continue
+            try:
+                self.template_manager.register_link(
+                    image_id, self._get_pool_id(volume), master_name)
+            except Exception as err:
+                LOG.warning("Count volume %(vol)s of master %(master)s "
+                            "failed. Reason: %(err)s",
+                            {"vol": volume.id, "master": master_name,
+                             "err": err})
+
+    def _rebuild_qos_refs(self, volumes):
+        """Count the volumes of each shared QoS policy."""
+        if not self.configuration.qos_policy_shared:
+            return
+        for volume in volumes:
+            try:
+                if fs_utils.get_volume_params(volume, self.client).get('qos'):
+                    self.fs_qos.register_volume(self._get_vol_name(volume))
+            except Exception as err:
+                LOG.warning("Count QoS policy of volume %(vol)s failed. "
+                            "Reason: %(err)s", {"vol": volume.id, "err": err})
+
+    def _quick_create_volume(self, context, volume, image_service,
+                             image_meta):
+        image_id = image_meta['id']
+        template_size = self._get_image_size(image_meta)
+        if volume.size < template_size:
+            LOG.info("Volume %(vol)s is smaller than image %(image)s, do not "
+                     "use quick start.", {"vol": volume.id, "image": image_id})
+            return None
+
+        pool_id = self._get_pool_id(volume)
+        master_name = self.template_manager.get_available_master(
+            image_id, pool_id)
+        if master_name is None:
+            master_name = self._extend_master(
+                context, volume, image_service, image_id, pool_id,
+                template_size)
+        LOG.info("Create volume %(vol)s from master snapshot %(snap)s.",
+                 {"vol": volume.id, "snap": master_name})
+
+        try:
+            return self._create_volume_from_master(
+                volume, image_id, master_name)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.template_manager.release_link(master_name)
+
+    def _extend_master(self, context, volume, image_service, image_id,
+                       pool_id, template_size):
+        def _create_template(vol_name):
+            self._create_template_volume(
+                context, volume, image_service, image_id, pool_id,
+                template_size, vol_name)
+
+        return self.template_manager.extend_master(
+            image_id, pool_id, _create_template)
+
+    def _create_template_volume(self, context, volume, image_service,
+                                image_id, pool_id, template_size, vol_name):
+        self.client.create_volume(
+            pool_id=pool_id, vol_name=vol_name,
+            vol_size=template_size * units.Ki)
+        template_volume = objects.Volume(
+            context=context, id=six.text_type(uuid.uuid4()),
+            size=template_size, host=volume.host, metadata={},
+            provider_location=json.dumps({"name": vol_name}),
+            multiattach=False, encryption_key_id=None,
+            volume_attachment=objects.VolumeAttachmentList())
+        try:
+            self.copy_image_to_volume(
+                context, template_volume, image_service, image_id)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.client.delete_volume(vol_name)
+
+    def _create_volume_from_master(self, volume, image_id, master_name):
+        vol_name = self._get_vol_name(volume)
+        vol_size = volume.size * units.Ki
+        self.client.create_volume_from_snapshot(
+            snapshot_name=master_name, vol_name=vol_name, vol_size=vol_size)
+        self._add_qos_to_volume(volume, vol_name)
+        self._expand_volume_when_create(vol_name, vol_size)
+
+        result = self.client.query_volume_by_name(vol_name=vol_name)
+        model_update = self._set_volume_lun_wwn(result, volume)
+        model_update['provider_location'] = json.dumps({
+            "name": vol_name, "master": master_name, "image_id": image_id})
+        return model_update
+
 
 class DSWAREDriver(DSWAREBaseDriver):
     def get_volume_stats(self, refresh=False):
@@ -1231,6 +1875,7 @@ class DSWAREDriver(DSWAREBaseDriver):
 
     def _attach_volume(self, context, volume, properties, remote=False):
         vol_name = self._get_vol_name(volume)
+        self._check_volume_hydrated(volume)
         if not self._check_volume_exist(volume):
             msg = _("Volume: %(vol_name)s does not exist!"
                     ) % {"vol_name": vol_name}
@@ -1256,20 +1901,34 @@ class DSWAREDriver(DSWAREBaseDriver):
     def initialize_connection(self, volume, connector):
         vol_name = self._get_vol_name(volume)
         manager_ip = self._get_manager_ip(connector)
+        self._check_volume_hydrated(volume)
         if not self._check_volume_exist(volume):
             msg = _("Volume: %(vol_name)s does not exist!"
                     ) % {"vol_name": vol_name}
             self._raise_exception(msg)
-        self.client.attach_volume(vol_name, manager_ip)
+        result = self.client.attach_volume(vol_name, manager_ip)
         volume_info = self.client.query_volume_by_name(vol_name=vol_name)
         vol_wwn = volume_info.get('wwn')
         by_id_path = "/dev/disk/by-id/wwn-0x%s" % vol_wwn
         properties = {'device_path': by_id_path}
 
-        LOG.info("Wait %(t)s second(s) for scanning the target device %(dev)s."
-                 % {"t": self.configuration.scan_device_timeout,
-                    "dev": by_id_path})
-        time.sleep(self.configuration.scan_device_timeout)
+        is_local = fs_utils.is_local_host(connector.get('host'))
+        dev_name = result.get(vol_name, [{}])[0].get('devName')
+        if not is_local and dev_name:
+            # The path of a remote node can not be checked, the array
+            # reports the device once the node has created it.
+            LOG.info("The array reports the device %(dev)s of volume "
+                     "%(vol)s on node %(ip)s.",
+                     {"dev": dev_name, "vol": vol_name, "ip": manager_ip})
+            return {'driver_volume_type': 'local',
+                    'data': properties}
+
+        LOG.info("Wait at most %(t)s second(s) for scanning the target "
+                 "device %(dev)s.",
+                 {"t": self.configuration.scan_device_timeout,
+                  "dev": by_id_path})
+        fs_utils.wait_for_device(
+            by_id_path, self.configuration.scan_device_timeout, is_local)
         return {'driver_volume_type': 'local',
                 'data': properties}
 
@@ -1285,6 +1944,8 @@ class DSWAREISCSIDriver(DSWAREBaseDriver):
     def __init__(self, *args, **kwargs):
         super(DSWAREISCSIDriver, self).__init__(*args, **kwargs)
         self.support_iscsi_links_balance_by_pool = False
+        self.mapping_batcher = fs_batch.RequestBatcher(
+            self.configuration.iscsi_mapping_batch_window)
 
     def do_setup(self, context):
         super(DSWAREISCSIDriver, self).do_setup(context)
@@ -1293,6 +1954,13 @@ class DSWAREISCSIDriver(DSWAREBaseDriver):
         else:
             self.support_iscsi_links_balance_by_pool = \
                 self.client.is_support_links_balance_by_pool()
+        # The session counts only order the portals picked from the
+        # manager groups or from the links of the array.
+        count_sessions = bool(
+            self.configuration.iscsi_manager_groups or
+            not (self.configuration.target_ips or
+                 self.support_iscsi_links_balance_by_pool))
+        self.client.portal_registry.start(count_sessions)
 
     def check_for_setup_error(self):
         super(DSWAREISCSIDriver, self).check_for_setup_error()
@@ -1304,7 +1972,6 @@ class DSWAREISCSIDriver(DSWAREBaseDriver):
         stats['storage_protocol'] = 'iSCSI'
         return stats
 
-    @coordination.synchronized('huawei-mapping-{connector[host]}')
     def initialize_connection(self, volume, connector):
         LOG.info("Start to initialize iscsi connection, volume: %(vol)s, "
                  "connector: %(con)s", {"vol": volume, "con": connector})
@@ -1314,23 +1981,38 @@ class DSWAREISCSIDriver(DSWAREBaseDriver):
             LOG.error(msg)
             raise exception.InvalidInput(reason=msg)
 
+        self._check_volume_hydrated(volume)
         vol_name = self._get_vol_name(volume)
         pool_name = volume_utils.extract_host(volume.host, level='pool')
         iscsi_params = {
             'configuration': self.configuration,
-            'manager_groups': self.manager_groups,
-            'thread_lock': self.lock,
             'pool_name': pool_name,
             'support_iscsi_links_balance_by_pool': self.support_iscsi_links_balance_by_pool
         }
-        properties = fs_flow.initialize_iscsi_connection(
-            self.client, vol_name, connector, iscsi_params)
-
-        LOG.info("Finish initialize iscsi connection, return: %s, the "
-                 "remaining manager groups are %s",
-                 properties, self.manager_groups)
+        # Volumes attached to the same host at the same time are mapped
+        # together, the mapping lock of the host is taken once per batch.
+        batch_key = (connector['host'], connector.get('initiator'),
+                     bool(connector.get('multipath')), pool_name)
+        properties = self.mapping_batcher.submit(
+            batch_key, vol_name,
+            lambda close_batch: self._initialize_connections(
+                close_batch, connector, iscsi_params))
+
+        LOG.info("Finish initialize iscsi connection, return: %s",
+                 properties)
         return {'driver_volume_type': 'iscsi', 'data': properties}
 
+    def _initialize_connections(self, close_batch, connector, iscsi_params):
+        host = connector['host']
+
+        @coordination.synchronized('huawei-mapping-{host}')
+        def _initialize_connections_locked(host):
+            vol_names = sorted(set(close_batch()))
+            return fs_flow.initialize_iscsi_connections(
+                self.client, vol_names, connector, iscsi_params)
+
+        return _initialize_connections_locked(host)
+
     def terminate_connection(self, volume, connector, **kwargs):
         host = connector['host'] if 'host' in connector else ""
 
@@ -13,16 +13,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import datetime
+import functools
 import hashlib
 import ipaddress
-import random
+import json
+import os
+import socket
 import time
 
 import pytz
 import six
+from eventlet import greenpool
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from oslo_utils import units
 
 from cinder import context
@@ -37,7 +41,10 @@ from cinder.volume import volume_types
 LOG = logging.getLogger(__name__)
 
 
-def is_volume_associate_to_host(client, vol_name, host_name):
+def is_volume_associate_to_host(client, vol_name, host_name, cached=True):
+    if cached and client.topology.enabled:
+        return host_name in client.topology.get_volume_hosts(vol_name)
+
     lun_host_list = client.get_host_by_volume(vol_name)
     for host in lun_host_list:
         if host.get('hostName') == host_name:
@@ -47,6 +54,9 @@ def is_volume_associate_to_host(client, vol_name, host_name):
 
 
 def is_initiator_add_to_array(client, initiator_name):
+    if client.topology.enabled:
+        return client.topology.has_initiator(initiator_name)
+
     initiator_list = client.get_all_initiator_on_array()
     for initiator in initiator_list:
         if initiator.get('portName') == initiator_name:
@@ -60,15 +70,6 @@ def is_initiator_associate_to_host(client, host_name, initiator_name):
     return initiator_name in initiator_list
 
 
-def get_target_lun(client, host_name, vol_name):
-    hostlun_list = client.get_host_lun(host_name)
-    for hostlun in hostlun_list:
-        if hostlun.get("lunName") == vol_name:
-            return hostlun.get("lunId")
-
-    return None
-
-
 def _get_target_portal(port_list, use_ipv6):
     for port in port_list:
         if port.get("iscsiStatus") == "active":
@@ -96,7 +97,10 @@ def is_lun_in_host(client, host_name):
     return len(hostlun_list)
 
 
-def is_host_add_to_array(client, host_name):
+def is_host_add_to_array(client, host_name, cached=True):
+    if cached and client.topology.enabled:
+        return client.topology.has_host(host_name)
+
     all_hosts = client.get_all_host()
     for host in all_hosts:
         if host.get("hostName") == host_name:
@@ -106,6 +110,9 @@ def is_host_add_to_array(client, host_name):
 
 
 def is_hostgroup_add_to_array(client, host_group_name):
+    if client.topology.enabled:
+        return client.topology.has_hostgroup(host_group_name)
+
     all_host_groups = client.get_all_hostgroup()
     for host_group in all_host_groups:
         if host_group.get("hostGroupName") == host_group_name:
@@ -114,13 +121,19 @@ def is_hostgroup_add_to_array(client, host_group_name):
     return False
 
 
+def _get_host_in_hostgroup(client, host_group_name):
+    if client.topology.enabled:
+        return client.topology.get_group_hosts(host_group_name)
+    return client.get_host_in_hostgroup(host_group_name)
+
+
 def is_host_group_empty(client, host_group_name):
-    all_host = client.get_host_in_hostgroup(host_group_name)
+    all_host = _get_host_in_hostgroup(client, host_group_name)
     return not all_host
 
 
 def is_host_in_host_group(client, host_name, host_group_name):
-    all_host = client.get_host_in_hostgroup(host_group_name)
+    all_host = _get_host_in_hostgroup(client, host_group_name)
     return host_name in all_host
 
 
@@ -140,16 +153,45 @@ def _get_volume_type(volume):
 def get_volume_type_params(volume_type, client):
     vol_params = {}
 
+    qos_specs = None
     if isinstance(volume_type, dict) and volume_type.get('qos_specs_id'):
-        vol_params['qos'] = get_qos_specs(volume_type['qos_specs_id'], client)
+        qos_specs = _get_volume_type_qos_specs(
+            volume_type.get('id'), volume_type['qos_specs_id'],
+            volume_type.get('updated_at'), client)
     elif isinstance(volume_type, objects.VolumeType
                     ) and volume_type.qos_specs_id:
-        vol_params['qos'] = get_qos_specs(volume_type.qos_specs_id, client)
+        qos_specs = _get_volume_type_qos_specs(
+            volume_type.id, volume_type.qos_specs_id,
+            volume_type.updated_at, client)
+
+    if qos_specs is not None:
+        # The QoS specs before the time scheduling is converted identify
+        # a shared QoS policy, see FusionStorageQoS.
+        vol_params[constants.QOS_SPECS] = qos_specs
+        vol_params['qos'] = _get_trigger_qos(copy.deepcopy(qos_specs),
+                                             client)
 
     LOG.info('volume opts %s.', vol_params)
     return vol_params
 
 
+def _get_volume_type_qos_specs(type_id, qos_specs_id, updated_at, client):
+    """Return the array QoS of a volume type, validated once per type.
+
+    The QoS without the time scheduling is cached by the client, the
+    scheduling depends on the current time and is converted by the caller
+    every time.
+    """
+    key = (type_id, qos_specs_id, six.text_type(updated_at))
+    qos_param = client.qos_param_cache.get(key)
+    if qos_param is None:
+        qos_param = get_static_qos_param(_load_qos_specs(qos_specs_id))
+        client.qos_param_cache.set(key, qos_param)
+    else:
+        LOG.debug("Use the cached QoS of volume type %s.", type_id)
+    return copy.deepcopy(qos_param)
+
+
 def _get_trigger_qos(qos, client):
     if qos.get(constants.QOS_SCHEDULER_KEYS[0]):
         if client.get_fsm_version() >= constants.QOS_SUPPORT_SCHEDULE_VERSION:
@@ -221,19 +263,33 @@ def _set_default_qos(qos):
         qos.pop("total_bytes_sec")
 
 
-def get_qos_specs(qos_specs_id, client):
+def _load_qos_specs(qos_specs_id):
     ctxt = context.get_admin_context()
     specs = qos_specs.get_qos_specs(ctxt, qos_specs_id)
     if not _is_qos_specs_valid(specs):
-        return {}
+        return None
 
     kvs = specs.get('specs', {})
     LOG.info('The QoS specs is: %s.', kvs)
+    return kvs
+
+
+def get_qos_specs(qos_specs_id, client):
+    kvs = _load_qos_specs(qos_specs_id)
+    if kvs is None:
+        return {}
 
     return get_qos_param(kvs, client)
 
 
-def get_qos_param(qos_vals, client):
+def get_static_qos_specs(qos_specs_id):
+    return get_static_qos_param(_load_qos_specs(qos_specs_id))
+
+
+def get_static_qos_param(qos_vals):
+    if qos_vals is None:
+        return {}
+
     qos_param = dict()
     for k, v in qos_vals.items():
         _raise_qos_is_invalid(k)
@@ -241,11 +297,13 @@ def get_qos_param(qos_vals, client):
 
     _raise_qos_not_set(qos_param)
     _set_default_qos(qos_param)
-    qos_param = _get_trigger_qos(qos_param, client)
-
     return qos_param
 
 
+def get_qos_param(qos_vals, client):
+    return _get_trigger_qos(get_static_qos_param(qos_vals), client)
+
+
 def _deal_date_increase_or_decrease(is_date_decrease, is_date_increase, qos):
     if is_date_decrease:
         config_date_sec = qos[constants.QOS_SCHEDULER_KEYS[1]]
@@ -586,23 +644,67 @@ def is_snapshot_rollback_available(client, snap_name):
     return False
 
 
-def wait_for_condition(func, interval, timeout):
-    start_time = time.time()
+def request_scoped(func):
+    """Run the driver operation in a request scope of the client.
 
-    def _inner():
-        result = func()
+    The volume reads of the operation are memoized until it changes the
+    array, see RestCommon.request_scope.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.client.request_scope():
+            return func(self, *args, **kwargs)
+    return wrapper
 
-        if result:
-            raise loopingcall.LoopingCallDone()
 
-        if int(time.time()) - start_time > timeout:
-            msg = (_('wait_for_condition: %s timed out.')
-                   % func.__name__)
-            LOG.error(msg)
-            raise exception.VolumeBackendAPIException(data=msg)
+def run_in_parallel(func, items, workers):
+    """Call func for each item with at most workers calls at a time.
+
+    Return a list of (item, result, error) in the order of items, a failed
+    call does not stop the others.
+    """
+    def _run(item):
+        try:
+            return item, func(item), None
+        except Exception as err:
+            return item, None, err
+
+    pool = greenpool.GreenPool(max(int(workers), 1))
+    return list(pool.imap(_run, items))
+
+
+def is_local_host(host_name):
+    return bool(host_name) and host_name in (
+        socket.gethostname(), socket.getfqdn())
+
 
-    timer = loopingcall.FixedIntervalLoopingCall(_inner)
-    timer.start(interval=interval).wait()
+def wait_for_device(device_path, timeout, is_local):
+    """Wait until device_path exists, at most timeout seconds.
+
+    The path can only be checked when the device is attached to this node,
+    it is polled with a growing interval until it shows up. For a remote
+    node whose device the array did not report, the whole timeout is
+    waited as before. Return the seconds it took.
+    """
+    start_time = time.time()
+    if not is_local:
+        time.sleep(timeout)
+        return timeout
+
+    interval = constants.DEVICE_POLL_INTERVAL
+    while not os.path.exists(device_path):
+        elapsed = time.time() - start_time
+        if elapsed >= timeout:
+            LOG.warning("The device %(dev)s is not ready after %(t)s "
+                        "second(s).", {"dev": device_path, "t": timeout})
+            return elapsed
+        time.sleep(min(interval, timeout - elapsed))
+        interval = min(interval * 2, constants.DEVICE_POLL_MAX_INTERVAL)
+
+    elapsed = time.time() - start_time
+    LOG.info("The device %(dev)s is ready after %(t).3f second(s).",
+             {"dev": device_path, "t": elapsed})
+    return elapsed
 
 
 def encode_host_name(host_name):
@@ -621,10 +723,9 @@ def encode_host_group_name(host_name):
         return host_group_name
 
 
-def get_valid_iscsi_info(client):
+def parse_valid_iscsi_info(all_iscsi_portal):
     valid_iscsi_ips = {}
     valid_node_ips = {}
-    all_iscsi_portal = client.get_iscsi_portal()
     for iscsi_info in all_iscsi_portal:
         if iscsi_info['status'] != 'successful':
             continue
@@ -647,6 +748,10 @@ def get_valid_iscsi_info(client):
     return valid_iscsi_ips, valid_node_ips
 
 
+def get_valid_iscsi_info(client):
+    return client.portal_registry.get_valid_iscsi_info()
+
+
 def _check_iscsi_ip_valid(manager_ip, valid_node_ips, use_ipv6):
     if manager_ip not in valid_node_ips:
         msg = _('The config manager ip %s is not valid node.') % manager_ip
@@ -697,14 +802,21 @@ def format_target_portal(portal):
     return target_portal, iscsi_ip
 
 
-def _get_manager_ips(manager_groups):
-    index = random.randint(0, len(manager_groups) - 1)
-    manager_group = manager_groups.pop(index)
+def _get_manager_groups_by_load(iscsi_manager_groups, valid_node_ips,
+                                session_counts):
+    """Return the manager ips of each group, the least loaded group first."""
+    groups = []
+    for manager_group in iscsi_manager_groups:
+        manager_ips = [manager_ip.strip() for manager_ip in
+                       manager_group.strip().split(";") if manager_ip.strip()]
+        load = sum(session_counts.get(node_ip, 0)
+                   for manager_ip in manager_ips
+                   for node_ip in valid_node_ips.get(manager_ip, []))
+        groups.append((load, manager_ips))
 
-    manager_ips = manager_group.strip().split(";")
-    LOG.info("Get iscsi ips %s.", manager_ips)
-    return [manager_ip.strip() for manager_ip in manager_ips
-            if manager_ip.strip()]
+    groups.sort(key=lambda group: group[0])
+    LOG.info("Manager groups ordered by iscsi session count: %s.", groups)
+    return [manager_ips for __, manager_ips in groups]
 
 
 def get_iscsi_info_from_host(client, host_name, valid_iscsi_ips):
@@ -723,6 +835,12 @@ def get_iscsi_info_from_host(client, host_name, valid_iscsi_ips):
     else:
         iscsi_ips = host_db_iscsi
 
+    if any(iscsi_ip not in valid_iscsi_ips for iscsi_ip in iscsi_ips):
+        # A portal of the host is missing, it may have failed or been added
+        # since the portals were probed, read them from the array again.
+        client.portal_registry.invalidate()
+        valid_iscsi_ips, __ = get_valid_iscsi_info(client)
+
     for iscsi_ip in iscsi_ips:
         if iscsi_ip in valid_iscsi_ips:
             target_ips.append(valid_iscsi_ips[iscsi_ip]["iscsi_portal"])
@@ -730,51 +848,58 @@ def get_iscsi_info_from_host(client, host_name, valid_iscsi_ips):
 
     if not target_ips:
         client.delete_iscsi_host_relation(host_name, host_db_iscsi)
+    else:
+        client.portal_registry.record_host_sessions(host_name, iscsi_ips)
     return target_ips, target_iqns
 
 
-def _get_target_info(manager_ips, use_ipv6, client):
+def _get_target_info(manager_ips, use_ipv6, client, link_count=None):
     valid_iscsi_ips, valid_node_ips = get_valid_iscsi_info(client)
-    node_ips, target_ips, target_iqns = [], [], []
+    node_ips = []
     for manager_ip in manager_ips:
         for node_ip in valid_node_ips.get(manager_ip, []):
             ip_version = ipaddress.ip_address(six.text_type(node_ip)).version
             if use_ipv6 ^ (ip_version == 6):
                 continue
             node_ips.append(node_ip)
-            target_ips.append(valid_iscsi_ips.get(node_ip, {}).get("iscsi_portal"))
-            target_iqns.append(valid_iscsi_ips.get(node_ip, {}).get("iscsi_target_iqn"))
 
+    if link_count:
+        # Keep the least loaded portals, equal ones stay in the given order.
+        session_counts = client.portal_registry.get_session_counts()
+        node_ips = sorted(node_ips, key=lambda node_ip: session_counts.get(
+            node_ip, 0))[:link_count]
+
+    target_ips = [valid_iscsi_ips.get(node_ip, {}).get("iscsi_portal")
+                  for node_ip in node_ips]
+    target_iqns = [valid_iscsi_ips.get(node_ip, {}).get("iscsi_target_iqn")
+                   for node_ip in node_ips]
     return node_ips, target_ips, target_iqns
 
 
-def get_iscsi_info_from_conf(manager_groups, iscsi_manager_groups,
-                             use_ipv6, thread_lock, client):
+def get_iscsi_info_from_conf(iscsi_manager_groups, use_ipv6, client,
+                             host_name=None, link_count=None):
     node_ips, target_ips, target_iqns = [], [], []
-    manager_group_len = len(manager_groups + iscsi_manager_groups)
-
-    for _ in range(manager_group_len):
-        thread_lock.acquire()
-        try:
-            manager_ips = _get_manager_ips(manager_groups)
-            if not manager_groups:
-                manager_groups.extend(iscsi_manager_groups)
-        except Exception as err:
-            # ensure release thread_lock
-            raise err
-        finally:
-            thread_lock.release()
+    __, valid_node_ips = get_valid_iscsi_info(client)
+    session_counts = client.portal_registry.get_session_counts()
 
+    for manager_ips in _get_manager_groups_by_load(
+            iscsi_manager_groups, valid_node_ips, session_counts):
         node_ips, target_ips, target_iqns = _get_target_info(
-            manager_ips, use_ipv6, client)
+            manager_ips, use_ipv6, client, link_count)
         if target_ips:
+            if host_name:
+                # Count the new sessions at once, so that concurrent attaches
+                # of other hosts see the load of this one.
+                client.portal_registry.record_host_sessions(
+                    host_name, node_ips)
             break
 
     return node_ips, target_ips, target_iqns
 
 
-def get_iscsi_info_from_storage(manager_ips, use_ipv6, client):
-    return _get_target_info(manager_ips, use_ipv6, client)
+def get_iscsi_info_from_storage(manager_ips, use_ipv6, client,
+                                link_count=None):
+    return _get_target_info(manager_ips, use_ipv6, client, link_count)
 
 
 def encode_name(my_uuid):
@@ -791,3 +916,29 @@ def get_volume_metadata(volume):
     for item in volume_metadata:
         result_data[item.get('key')] = item.get('value')
     return result_data
+
+
+def get_volume_by_id(volume_id):
+    return objects.Volume.get_by_id(context.get_admin_context(), volume_id)
+
+
+def get_provider_location(volume):
+    provider_location = volume.get("provider_location", None)
+    if not provider_location:
+        return {}
+    try:
+        return json.loads(provider_location)
+    except Exception as err:
+        LOG.warning("Get volume provider_location %(loc)s error. "
+                    "Reason: %(err)s", {"loc": provider_location, "err": err})
+        return {}
+
+
+def update_provider_location(volume_id, updates, status=None):
+    volume = get_volume_by_id(volume_id)
+    provider_location = get_provider_location(volume)
+    provider_location.update(updates)
+    volume.provider_location = json.dumps(provider_location)
+    if status:
+        volume.status = status
+    volume.save()
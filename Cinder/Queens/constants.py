@@ -19,14 +19,87 @@ GET_VOLUME_PAGE_NUM = 1
 GET_VOLUME_PAGE_SIZE = 1000
 GET_SNAPSHOT_PAGE_NUM = 1
 GET_SNAPSHOT_PAGE_SIZE = 1000
+SNAPSHOT_CACHE_SIZE = 4096
+SNAPSHOT_CACHE_TTL = 60
+QOS_PARAM_CACHE_SIZE = 256
+QOS_PARAM_CACHE_TTL = 300
 GET_QOS_PAGE_NUM = 1
 GET_QOS_PAGE_SIZE = 100
+DEFAULT_PAGE_FETCH_WORKERS = 8
+DEFAULT_POOL_CACHE_TTL = 60
+DEFAULT_TOPOLOGY_CACHE_TTL = 300
+DEFAULT_MAPPING_BATCH_WINDOW = 0
+DEFAULT_PORTAL_CACHE_TTL = 30
+DEFAULT_SESSION_COUNT_INTERVAL = 1800
+DEFAULT_CLUSTER_FACTS_TTL = 3600
+DEFAULT_STATS_INTERVAL = 30
+DEFAULT_STATS_MAX_AGE = 300
+DEFAULT_QUICKSTART_MAX_LINK_NUM = 128
+DEFAULT_QUICKSTART_REFILL_INTERVAL = 10
+DEFAULT_QUICKSTART_HIGH_WATER = 0.8
+DEVICE_POLL_INTERVAL = 0.1
+DEVICE_POLL_MAX_INTERVAL = 1
+STATUS_POLL_TICK = 1
+STATUS_POLL_WORKERS = 8
+POLL_MIN_INTERVAL = 1
+POLL_MAX_FACTOR = 12
+POLL_JITTER = 0.2
+POLL_PROGRESS_FINISH = 100
+POLL_SCHEDULE_FIXED = 'fixed'
+POLL_SCHEDULE_EXPONENTIAL = 'exponential'
+POLL_SCHEDULE_PROGRESS = 'progress'
+POLL_SCHEDULE_CAPPED = 'capped'
+POLL_SCHEDULE_KINDS = (POLL_SCHEDULE_FIXED, POLL_SCHEDULE_EXPONENTIAL,
+                       POLL_SCHEDULE_PROGRESS, POLL_SCHEDULE_CAPPED)
+POLL_OP_DEFAULT = 'default'
+POLL_OP_CLONE = 'clone'
+POLL_OP_MIGRATION = 'migration'
+POLL_OP_ROLLBACK = 'rollback'
+POLL_OP_VOLUME_READY = 'volume_ready'
+DEFAULT_POLL_SCHEDULES = {
+    POLL_OP_DEFAULT: POLL_SCHEDULE_FIXED,
+    POLL_OP_CLONE: POLL_SCHEDULE_CAPPED,
+    POLL_OP_MIGRATION: POLL_SCHEDULE_PROGRESS,
+    POLL_OP_ROLLBACK: POLL_SCHEDULE_PROGRESS,
+    POLL_OP_VOLUME_READY: POLL_SCHEDULE_CAPPED,
+}
+DEFAULT_HYDRATION_CONCURRENCY = 4
+HYDRATION_START_TIMEOUT = 3600
+HYDRATION_STATUS_KEY = 'hydration_status'
+HYDRATION_SOURCE_KEY = 'hydration_source'
+HYDRATION_TEMP_SNAPSHOT_KEY = 'hydration_temp_snapshot'
+HYDRATION_QUEUED = 'queued'
+HYDRATION_COPYING = 'copying'
+HYDRATION_DONE = 'done'
+HYDRATION_FAILED = 'failed'
+DEFAULT_HEAVY_JOBS_PER_POOL = 4
+DEFAULT_HEAVY_JOB_WAIT_TIMEOUT = 6 * 3600
+DEFAULT_HEAVY_JOB_LOAD_SMOOTHING = 0.3
+JOB_ROLLBACK = 'rollback'
+JOB_FULL_CLONE = 'full_clone'
+JOB_MIGRATION = 'migration'
+JOB_HYDRATION = 'hydration'
+JOB_PRIORITIES = {
+    JOB_ROLLBACK: 0,
+    JOB_FULL_CLONE: 1,
+    JOB_MIGRATION: 2,
+    JOB_HYDRATION: 3,
+}
+MIGRATION_SPEED_LOW = 1
+MIGRATION_SPEED_MEDIUM = 2
+MIGRATION_SPEED_HIGH = 3
+POOL_BUSY_USAGE = 0.8
+DEFAULT_GROUP_OPERATION_WORKERS = 8
+DEFAULT_DELETE_BATCH_WINDOW = 0
+DELETE_VOLUME_BATCH_SIZE = 100
+DELETE_VOLUME_RETRIES = 3
+DELETE_VOLUME_RETRY_INTERVAL = 30
 
 CONNECT_ERROR = 403
 ERROR_UNAUTHORIZED = 10000003
 ERROR_USER_OFFLINE = '1077949069'
 VOLUME_NOT_EXIST = (31000000, 50150005, 32150005)
-SNAPSHOT_NOT_EXIST = (50150006,)
+SNAPSHOT_NOT_EXIST = (50150006, 32150006)
 
 BASIC_URI = '/dsware/service/'
 CONF_PATH = "/etc/cinder/cinder.conf"
@@ -64,6 +137,8 @@ QOS_SCHEDULER_DEFAULT_TYPE = "0"
 QOS_SCHEDULER_WEEK_TYPE = "3"
 QOS_SUPPORT_SCHEDULE_VERSION = "8.0"
 QOS_MAX_INTERCEPT_LENGTH = 36
+QOS_SHARED_PREFIX = "OpenStack_Shared_"
+QOS_FINGERPRINT_LENGTH = 40
 SECONDS_OF_DAY = 24 * 60 * 60
 SECONDS_OF_HOUR = 60 * 60
 SNAPSHOT_HEALTH_STATUS = (
@@ -100,3 +175,4 @@ REST_VOLUME_CREATE_SUCCESS_STATUS = 0
 CLONE_VOLUME_TIMEOUT = 3600 * 24 * 30
 
 QOS = 'qos'
+QOS_SPECS = 'qos_specs'
@@ -14,6 +14,7 @@
 #    under the License.
 
 from oslo_log import log as logging
+from oslo_utils import excutils
 
 import taskflow.engines
 from taskflow.patterns import linear_flow
@@ -199,21 +200,42 @@ class DeleteInitiatorFromHostWithCheck(task.Task):
         return is_initiator_in_host, initiator_list
 
 
-class MapLunToHostTask(task.Task):
+class MapLunsToHostTask(task.Task):
+    default_provides = 'map_errors'
+
     def __init__(self, client, *args, **kwargs):
-        super(MapLunToHostTask, self).__init__(*args, **kwargs)
+        super(MapLunsToHostTask, self).__init__(*args, **kwargs)
         self.client = client
 
-    def execute(self, host_name, vol_name):
-        LOG.info("Map lun: %(lun)s to host %(host)s.",
-                 {"lun": vol_name, "host": host_name})
-        self.client.map_volume_to_host(host_name, vol_name)
-
-    def revert(self, result, host_name, vol_name, **kwargs):
-        LOG.warning("Revert map lun to host task.")
+    def execute(self, host_name, lun_names):
+        LOG.info("Map luns: %(lun)s to host %(host)s.",
+                 {"lun": lun_names, "host": host_name})
+        try:
+            self.client.map_volumes_to_host(host_name, lun_names)
+            return {}
+        except Exception as err:
+            LOG.warning("Map luns to host %(host)s in one request failed, "
+                        "map them one by one. Reason: %(err)s",
+                        {"host": host_name, "err": err})
+
+        map_errors = {}
+        for lun_name in lun_names:
+            try:
+                self.client.map_volume_to_host(host_name, lun_name)
+            except Exception as err:
+                map_errors[lun_name] = err
+
+        if len(map_errors) == len(lun_names):
+            raise map_errors[lun_names[-1]]
+        return map_errors
+
+    def revert(self, result, host_name, lun_names, **kwargs):
+        LOG.warning("Revert map luns to host task.")
         if isinstance(result, failure.Failure):
             return
-        self.client.unmap_volume_from_host(host_name, vol_name)
+        for lun_name in lun_names:
+            if lun_name not in result:
+                self.client.unmap_volume_from_host(host_name, lun_name)
 
 
 class UnMapLunFromHostTask(task.Task):
@@ -234,8 +256,6 @@ class GetISCSIProperties(task.Task):
         super(GetISCSIProperties, self).__init__(*args, **kwargs)
         self.client = client
         self.configuration = iscsi_params.get('configuration')
-        self.manager_groups = iscsi_params.get('manager_groups')
-        self.thread_lock = iscsi_params.get('thread_lock')
         self.pool_name = iscsi_params.get("pool_name")
         self.support_iscsi_links_balance_by_pool = iscsi_params.get(
             "support_iscsi_links_balance_by_pool")
@@ -303,8 +323,8 @@ class GetISCSIProperties(task.Task):
         if not target_ips:
             (node_ips, target_ips, target_iqns
              ) = fs_utils.get_iscsi_info_from_conf(
-                self.manager_groups, iscsi_manager_groups,
-                self.configuration.use_ipv6, self.thread_lock, self.client)
+                iscsi_manager_groups, self.configuration.use_ipv6,
+                self.client, host_name, self.configuration.iscsi_link_count)
             if target_ips:
                 self.client.add_iscsi_host_relation(host_name, node_ips)
 
@@ -329,7 +349,8 @@ class GetISCSIProperties(task.Task):
                 self.configuration.pools_name)
             (node_ips, target_ips, target_iqns
              ) = fs_utils.get_iscsi_info_from_storage(
-                iscsi_links, self.configuration.use_ipv6, self.client)
+                iscsi_links, self.configuration.use_ipv6, self.client,
+                self.configuration.iscsi_link_count)
             if target_ips:
                 self.client.add_iscsi_host_relation(host_name, node_ips)
 
@@ -351,23 +372,65 @@ class GetISCSIProperties(task.Task):
             iscsi_links_result.get("iscsiLinks", []))
         return target_ips_format, target_iqns
 
-    def execute(self, host_name, vol_name, multipath):
-        LOG.info("Get ISCSI initialize connection properties.")
-        target_lun = fs_utils.get_target_lun(self.client, host_name, vol_name)
-
+    def _find_target_info(self, host_name):
         if self.configuration.iscsi_manager_groups:
-            target_ips, target_iqns = self._find_iscsi_ips(host_name)
+            return self._find_iscsi_ips(host_name)
         elif self.configuration.target_ips:
-            target_ips, target_iqns = self._find_target_ips()
+            return self._find_target_ips()
         elif self.pool_name and self.support_iscsi_links_balance_by_pool:
-            target_ips, target_iqns = self._find_iscsi_ips_from_storage_pool(
+            return self._find_iscsi_ips_from_storage_pool(
                 host_name, self.pool_name)
-        else:
-            target_ips, target_iqns = self._find_iscsi_ips_from_storage(
-                host_name)
-
-        return self._construct_properties(multipath, target_lun,
-                                          target_ips, target_iqns)
+        return self._find_iscsi_ips_from_storage(host_name)
+
+
+class GetISCSIPropertiesOfLuns(GetISCSIProperties):
+    default_provides = 'properties_map'
+
+    def _get_host_luns(self, host_name):
+        return dict((hostlun.get("lunName"), hostlun.get("lunId"))
+                    for hostlun in self.client.get_host_lun(host_name))
+
+    def _remap_luns(self, host_name, lun_names, map_errors):
+        # The topology cache reported these luns as mapped, but the array
+        # does not list them, forget them and map them again.
+        LOG.warning("Luns %(lun)s are not mapped to host %(host)s as the "
+                    "array topology cache says, map them again.",
+                    {"lun": lun_names, "host": host_name})
+        map_errors = dict(map_errors)
+        for lun_name in lun_names:
+            self.client.topology.forget_volume(lun_name)
+            try:
+                self.client.map_volume_to_host(host_name, lun_name)
+            except Exception as err:
+                map_errors[lun_name] = err
+        return map_errors
+
+    def execute(self, host_name, vol_names, multipath, map_errors):
+        LOG.info("Get ISCSI initialize connection properties of luns: %s.",
+                 vol_names)
+        host_luns = self._get_host_luns(host_name)
+        missing_luns = [vol_name for vol_name in vol_names
+                        if vol_name not in map_errors and
+                        host_luns.get(vol_name) is None]
+        if missing_luns:
+            map_errors = self._remap_luns(host_name, missing_luns, map_errors)
+            host_luns = self._get_host_luns(host_name)
+        target_ips, target_iqns = self._find_target_info(host_name)
+
+        properties_map = {}
+        for vol_name in vol_names:
+            if vol_name in map_errors:
+                properties_map[vol_name] = map_errors[vol_name]
+            elif host_luns.get(vol_name) is None:
+                msg = _("The lun %(lun)s is not mapped to host %(host)s."
+                        ) % {"lun": vol_name, "host": host_name}
+                properties_map[vol_name] = (
+                    exception.VolumeBackendAPIException(data=msg))
+            else:
+                properties_map[vol_name] = self._construct_properties(
+                    multipath, host_luns[vol_name],
+                    list(target_ips), list(target_iqns))
+        return properties_map
 
 
 def get_iscsi_required_params(vol_name, connector, client=None):
@@ -403,40 +466,89 @@ def get_iscsi_required_params(vol_name, connector, client=None):
     return vol_name, host_name, host_group_name, initiator_name, multipath
 
 
-def initialize_iscsi_connection(client, vol_name, connector, iscsi_params):
-    (vol_name, host_name, host_group_name, initiator_name,
-     multipath) = get_iscsi_required_params(vol_name, connector)
+def initialize_iscsi_connections(client, vol_names, connector, iscsi_params):
+    """Map several luns to one host and return the properties of each lun.
+
+    The host, host group and initiator are prepared once, all the luns that
+    are not mapped yet are mapped in one request, and the target information
+    is looked up once for the whole batch. A lun that can not be mapped gets
+    its exception instead of its properties.
+    """
+    (__, host_name, host_group_name, initiator_name,
+     multipath) = get_iscsi_required_params(vol_names[0], connector)
 
     store_spec = {
-        'vol_name': vol_name,
+        'vol_names': vol_names,
         'host_name': host_name,
         'host_group_name': host_group_name,
         'initiator_name': initiator_name,
         'multipath': multipath,
         'connector_host_name': connector.get("host")
     }
-    work_flow = linear_flow.Flow('initialize_iscsi_connection')
-
-    if fs_utils.is_volume_associate_to_host(client, vol_name, host_name):
-        LOG.info("Volume: %(vol)s has associated to the host: %(host)s",
-                 {"vol": vol_name, "host": host_name})
-    else:
+    try:
+        return _run_initialize_iscsi_batch_flow(
+            client, vol_names, host_name, iscsi_params, store_spec)
+    except Exception as err:
+        # The failure may come from a portal that went down since it was
+        # probed, do not hand out the cached portals again.
+        client.portal_registry.invalidate()
+        if not client.topology.enabled:
+            raise
+        LOG.warning("Initialize iscsi connections failed, reconcile the "
+                    "array topology and retry. Reason: %s", err)
+        client.topology.mark_stale()
+        return _run_initialize_iscsi_batch_flow(
+            client, vol_names, host_name, iscsi_params, store_spec)
+
+
+def _run_initialize_iscsi_batch_flow(client, vol_names, host_name,
+                                     iscsi_params, store_spec):
+    work_flow = linear_flow.Flow('initialize_iscsi_connections')
+    store_spec = dict(store_spec)
+
+    lun_names = [vol_name for vol_name in vol_names
+                 if not fs_utils.is_volume_associate_to_host(
+                     client, vol_name, host_name)]
+    if lun_names:
+        store_spec['lun_names'] = lun_names
         work_flow.add(
             CreateHostCheckTask(client),
             CreateHostGroupWithCheckTask(client),
             AddHostToHostGroupTask(client),
             AddInitiatorWithCheckTask(client),
             AssociateInitiatorToHostTask(client),
-            MapLunToHostTask(client)
+            MapLunsToHostTask(client)
         )
+    else:
+        LOG.info("Volumes: %(vol)s have associated to the host: %(host)s",
+                 {"vol": vol_names, "host": host_name})
+        store_spec['map_errors'] = {}
 
     work_flow.add(
-        GetISCSIProperties(client, iscsi_params)
+        GetISCSIPropertiesOfLuns(client, iscsi_params)
     )
 
     engine = taskflow.engines.load(work_flow, store=store_spec)
     engine.run()
-    return engine.storage.fetch('properties')
+    return engine.storage.fetch('properties_map')
+
+
+def _is_on_array(check, client, *args):
+    """Confirm on the array an object the topology cache reports absent.
+
+    Skipping an unmap because of a stale cache would leave the lun mapped
+    to the host, so only the array can tell that there is nothing to do.
+    """
+    if check(client, *args):
+        return True
+    if not client.topology.enabled:
+        return False
+    if check(client, *args, cached=False):
+        LOG.warning("Array topology cache is out of date for %s.",
+                    ", ".join(args))
+        client.topology.mark_stale()
+        return True
+    return False
 
 
 def terminate_iscsi_connection(client, vol_name, connector):
@@ -449,8 +561,10 @@ def terminate_iscsi_connection(client, vol_name, connector):
         'host_group_name': host_group_name
     }
     work_flow = linear_flow.Flow('terminate_iscsi_connection')
-    if host_name and fs_utils.is_host_add_to_array(client, host_name):
-        if fs_utils.is_volume_associate_to_host(client, vol_name, host_name):
+    if host_name and _is_on_array(fs_utils.is_host_add_to_array,
+                                  client, host_name):
+        if _is_on_array(fs_utils.is_volume_associate_to_host,
+                        client, vol_name, host_name):
             work_flow.add(
                 UnMapLunFromHostTask(client)
             )
@@ -464,4 +578,8 @@ def terminate_iscsi_connection(client, vol_name, connector):
         )
 
         engine = taskflow.engines.load(work_flow, store=store_spec)
-        engine.run()
+        try:
+            engine.run()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                client.topology.mark_stale()
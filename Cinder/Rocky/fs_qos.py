@@ -13,10 +13,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import hashlib
+import json
+import threading
 import time
 
 from oslo_log import log as logging
 
+from cinder import coordination
 from cinder import exception
 from cinder.volume.drivers.fusionstorage import constants
 
@@ -24,10 +29,36 @@ LOG = logging.getLogger(__name__)
 
 
 class FusionStorageQoS(object):
-    def __init__(self, client):
+    def __init__(self, client, pool_catalogue=None, shared=False):
         self.client = client
+        self.pool_catalogue = pool_catalogue
+        # In shared mode the volumes with the same QoS specs use one policy,
+        # named after the hash of the specs before their time scheduling is
+        # converted, which changes with the time of day. The driver counts
+        # the volumes it associates with each policy, and only asks the
+        # array whether other volumes still use a policy once its count
+        # drops to zero. The counts are rebuilt at setup, see
+        # register_volume.
+        self.shared = shared
+        self._ref_lock = threading.Lock()
+        self._ref_counts = collections.Counter()
+
+    @staticmethod
+    def _get_shared_qos_name(specs):
+        fingerprint = hashlib.sha256(json.dumps(
+            specs, sort_keys=True).encode('utf-8')).hexdigest()
+        return (constants.QOS_SHARED_PREFIX +
+                fingerprint[:constants.QOS_FINGERPRINT_LENGTH])
+
+    @staticmethod
+    def _is_shared_qos(qos_name):
+        return qos_name.startswith(constants.QOS_SHARED_PREFIX)
+
+    def add(self, qos, vol_name, specs=None):
+        if self.shared:
+            self._add_shared(qos, vol_name, specs or qos)
+            return
 
-    def add(self, qos, vol_name):
         localtime = time.strftime('%Y%m%d%H%M%S', time.localtime())
         # QoS policy name. The value contains 1 to 63 characters.
         # So we intercept volume_name Ensure that the length does not exceed 63
@@ -41,8 +72,62 @@ class FusionStorageQoS(object):
             self.remove(vol_name)
             raise
 
+    def _add_shared(self, qos, vol_name, specs):
+        @coordination.synchronized('huawei-qos-{qos_name}')
+        def _associate(qos_name):
+            with self._ref_lock:
+                known = self._ref_counts[qos_name] > 0
+            if not known:
+                try:
+                    self.client.create_qos(qos_name, qos)
+                except exception.VolumeBackendAPIException:
+                    # The policy is left from an earlier run of the driver
+                    # or was created by another host, associating tells.
+                    LOG.info("Create shared QoS %s failed, try to use the "
+                             "existing one.", qos_name)
+
+            try:
+                self.client.associate_qos_with_volume(vol_name, qos_name)
+            except exception.VolumeBackendAPIException:
+                if not known and not self._is_qos_associate_to_volume(
+                        qos_name):
+                    self.client.delete_qos(qos_name)
+                raise
+            with self._ref_lock:
+                self._ref_counts[qos_name] += 1
+
+        _associate(self._get_shared_qos_name(specs))
+
+    def register_volume(self, vol_name):
+        """Count a volume that is associated with a shared policy."""
+        if not self.shared:
+            return
+        qos_name = self.client.get_qos_by_vol_name(vol_name).get("qosName")
+        if qos_name and self._is_shared_qos(qos_name):
+            with self._ref_lock:
+                self._ref_counts[qos_name] += 1
+
+    def _remove_shared(self, vol_name, qos_name):
+        @coordination.synchronized('huawei-qos-{qos_name}')
+        def _disassociate(qos_name):
+            self.client.disassociate_qos_with_volume(vol_name, qos_name)
+            with self._ref_lock:
+                if self._ref_counts[qos_name] > 0:
+                    self._ref_counts[qos_name] -= 1
+                if self._ref_counts[qos_name] > 0:
+                    return
+                self._ref_counts.pop(qos_name, None)
+
+            if not self._is_qos_associate_to_volume(qos_name):
+                self.client.delete_qos(qos_name)
+
+        _disassociate(qos_name)
+
     def _is_qos_associate_to_volume(self, qos_name):
-        all_pools = self.client.query_storage_pool_info()
+        if self.pool_catalogue:
+            all_pools = self.pool_catalogue.get_pools()
+        else:
+            all_pools = self.client.query_storage_pool_info()
         volumes = None
         for pool in all_pools:
             volumes = self.client.get_qos_volume_info(
@@ -51,17 +136,37 @@ class FusionStorageQoS(object):
                 break
         return volumes
 
-    def remove(self, vol_name):
-        vol_qos = self.client.get_qos_by_vol_name(vol_name)
-        qos_name = vol_qos.get("qosName")
-        if qos_name:
-            self.client.disassociate_qos_with_volume(vol_name, qos_name)
+    def remove(self, vol_name, qos_name=None):
+        if not qos_name:
+            vol_qos = self.client.get_qos_by_vol_name(vol_name)
+            qos_name = vol_qos.get("qosName")
+        if not qos_name:
+            return
 
-            if not self._is_qos_associate_to_volume(qos_name):
-                self.client.delete_qos(qos_name)
+        if self._is_shared_qos(qos_name):
+            self._remove_shared(vol_name, qos_name)
+            return
+
+        self.client.disassociate_qos_with_volume(vol_name, qos_name)
+
+        if not self._is_qos_associate_to_volume(qos_name):
+            self.client.delete_qos(qos_name)
 
-    def update(self, qos, vol_name):
-        vol_qos = self.client.get_qos_by_vol_name(vol_name)
-        qos_name = vol_qos.get("qosName")
-        if qos_name:
+    def update(self, qos, vol_name, qos_name=None, specs=None):
+        if not qos_name:
+            vol_qos = self.client.get_qos_by_vol_name(vol_name)
+            qos_name = vol_qos.get("qosName")
+        if not qos_name:
+            return
+
+        if not self.shared and not self._is_shared_qos(qos_name):
             self.client.modify_qos(qos_name, qos)
+            return
+
+        # A shared policy is never modified in place, the volume moves to
+        # the policy of its new specs instead.
+        if self.shared and qos_name == self._get_shared_qos_name(
+                specs or qos):
+            return
+        self.remove(vol_name, qos_name)
+        self.add(qos, vol_name, specs)
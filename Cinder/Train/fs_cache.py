@@ -0,0 +1,493 @@
+# Copyright (c) 2025 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import copy
+import threading
+import time
+
+from oslo_log import log as logging
+from oslo_service import loopingcall
+
+from cinder.volume.drivers.fusionstorage import fs_utils
+
+LOG = logging.getLogger(__name__)
+
+
+class VolumeIndex(object):
+    """Per-pool index of array volumes keyed by volume id and name.
+
+    A pool is filled by one bulk scan of /volume/list, afterwards it is
+    kept up to date by the volumes the driver itself queries, creates and
+    deletes. An indexed volume is checked on the array before it is used,
+    a volume missing from the index makes the caller scan the pool again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_name = {}
+
+    @staticmethod
+    def _key(value):
+        return str(value)
+
+    def load(self, pool_id, vol_list):
+        pool_key = self._key(pool_id)
+        with self._lock:
+            for vol_name, vol_info in list(self._by_name.items()):
+                if self._key(vol_info.get('poolId')) == pool_key:
+                    self._by_name.pop(vol_name, None)
+            self._by_id[pool_key] = {}
+            for vol_info in vol_list:
+                self._add(pool_key, vol_info)
+        LOG.info("Volume index of pool %(pool)s loaded with %(num)s volumes.",
+                 {"pool": pool_id, "num": len(vol_list)})
+
+    def _add(self, pool_key, vol_info):
+        vol_id = vol_info.get('volId')
+        vol_name = vol_info.get('volName')
+        if vol_id is None or not vol_name:
+            return
+        self._by_id.setdefault(pool_key, {})[self._key(vol_id)] = vol_info
+        self._by_name[vol_name] = vol_info
+
+    def add(self, vol_info):
+        if not vol_info or vol_info.get('poolId') is None:
+            return
+        with self._lock:
+            self._add(self._key(vol_info.get('poolId')), vol_info)
+
+    def remove(self, vol_name):
+        with self._lock:
+            vol_info = self._by_name.pop(vol_name, None)
+            if not vol_info:
+                return
+            pool_volumes = self._by_id.get(
+                self._key(vol_info.get('poolId')), {})
+            pool_volumes.pop(self._key(vol_info.get('volId')), None)
+
+    def get_by_id(self, pool_id, vol_id):
+        return self._by_id.get(self._key(pool_id), {}).get(self._key(vol_id))
+
+    def get_by_name(self, vol_name):
+        return self._by_name.get(vol_name)
+
+
+class LRUCache(object):
+    """A bounded least-recently-used cache with optional entry expiry."""
+
+    def __init__(self, capacity, ttl=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, stored_time = entry
+            if self.ttl is not None and time.time() - stored_time > self.ttl:
+                return None
+            # Re-insert to mark the entry as the most recently used one.
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time())
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class StoragePoolCatalogue(object):
+    """Storage pools of the array by name and id.
+
+    The catalogue is refreshed in the background every ttl seconds, so
+    resolving a pool costs no REST call in the common case. If the
+    background refresh stalls, the data is refreshed synchronously once it
+    is older than twice the ttl. A ttl of 0 disables caching.
+    """
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pools = []
+        self._by_name = {}
+        self._by_id = {}
+        self._refresh_time = None
+        self._timer = None
+
+    def start(self):
+        if self.ttl <= 0 or self._timer:
+            return
+        self._timer = loopingcall.FixedIntervalLoopingCall(
+            self._periodic_refresh)
+        self._timer.start(interval=self.ttl, initial_delay=self.ttl)
+
+    def _periodic_refresh(self):
+        try:
+            self.refresh()
+        except Exception as err:
+            LOG.warning("Refresh storage pool catalogue failed. "
+                        "Reason: %s", err)
+
+    def refresh(self):
+        all_pools = self.client.query_storage_pool_info()
+        with self._lock:
+            self._pools = all_pools
+            self._by_name = dict((pool['poolName'], pool)
+                                 for pool in all_pools
+                                 if pool.get('poolName'))
+            self._by_id = dict((int(pool['poolId']), pool)
+                               for pool in all_pools
+                               if pool.get('poolId') is not None)
+            self._refresh_time = time.time()
+        return all_pools
+
+    def _is_expired(self):
+        return (self.ttl <= 0 or self._refresh_time is None or
+                time.time() - self._refresh_time > self.ttl * 2)
+
+    def get_pools(self, force_refresh=False):
+        if force_refresh or self._is_expired():
+            return self.refresh()
+        return self._pools
+
+    def get_pool_ids(self, pool_name):
+        """Return the ids of the pools whose name or id is pool_name."""
+        self.get_pools()
+        pool_id_list = []
+        pool = self._by_name.get(pool_name)
+        if pool:
+            pool_id_list.append(pool['poolId'])
+        if pool_name.isdigit():
+            pool = self._by_id.get(int(pool_name))
+            if pool:
+                pool_id_list.append(pool['poolId'])
+        return pool_id_list
+
+    def get_pool_by_id(self, pool_id):
+        self.get_pools()
+        return self._by_id.get(int(pool_id))
+
+
+class StatsCollector(object):
+    """Collects the backend stats in the background every interval seconds.
+
+    get() returns the latest sample at once, with its age. The stats are
+    only collected synchronously when the sample is older than max_age,
+    for example because the array stopped answering the background
+    collection. An interval of 0 collects the stats on every get().
+    """
+
+    def __init__(self, collect, interval, max_age):
+        self.collect = collect
+        self.interval = interval
+        self.max_age = max(max_age, interval)
+        self._lock = threading.Lock()
+        self._stats = None
+        self._collect_time = None
+        self._timer = None
+
+    def start(self):
+        if self.interval <= 0 or self._timer:
+            return
+        self._timer = loopingcall.FixedIntervalLoopingCall(
+            self._periodic_collect)
+        self._timer.start(interval=self.interval,
+                          initial_delay=self.interval)
+
+    def _periodic_collect(self):
+        try:
+            self.refresh()
+        except Exception as err:
+            LOG.warning("Collect backend stats failed. Reason: %s", err)
+
+    def refresh(self):
+        stats = self.collect()
+        with self._lock:
+            self._stats = stats
+            self._collect_time = time.time()
+
+    def get(self):
+        """Return a copy of the latest stats and their age in seconds."""
+        if (self.interval <= 0 or self._collect_time is None or
+                time.time() - self._collect_time > self.max_age):
+            LOG.info("Backend stats are missing or stale, collect them now.")
+            self.refresh()
+        with self._lock:
+            return (copy.deepcopy(self._stats),
+                    time.time() - self._collect_time)
+
+
+class ISCSIPortalRegistry(object):
+    """Active iSCSI portals of the array and the hosts logged in to them.
+
+    The portals are probed in the background every ttl seconds. They are
+    reloaded synchronously when the data is older than twice the ttl or
+    has been invalidated after a portal failed. The registry also counts
+    the hosts logged in to each portal, for the link selection. Reading the
+    counts costs a request per host of the array, so they are only read
+    when started with count_sessions, every session_interval seconds, and
+    the attaches of this driver add to them in between. A ttl of 0
+    disables caching and a session_interval of 0 disables the counting on
+    the array, then only the attaches of this driver count.
+    """
+
+    def __init__(self, client, ttl, session_interval=0):
+        self.client = client
+        self.ttl = ttl
+        self.session_interval = session_interval
+        self._lock = threading.Lock()
+        self._valid_iscsi_ips = {}
+        self._valid_node_ips = {}
+        self._host_sessions = {}
+        self._refresh_time = None
+        self._timer = None
+        self._session_timer = None
+
+    def start(self, count_sessions=False):
+        if self.ttl > 0 and not self._timer:
+            self._timer = loopingcall.FixedIntervalLoopingCall(
+                self._periodic_refresh)
+            self._timer.start(interval=self.ttl)
+
+        if (count_sessions and self.session_interval > 0 and
+                not self._session_timer):
+            self._session_timer = loopingcall.FixedIntervalLoopingCall(
+                self._periodic_count_sessions)
+            # Count the sessions that exist before the first attach.
+            self._session_timer.start(interval=self.session_interval,
+                                      initial_delay=0)
+
+    def _periodic_refresh(self):
+        try:
+            self.refresh()
+        except Exception as err:
+            LOG.warning("Probe iscsi portals failed. Reason: %s", err)
+
+    def _periodic_count_sessions(self):
+        try:
+            self.refresh_sessions()
+        except Exception as err:
+            LOG.warning("Count iscsi sessions failed. Reason: %s", err)
+
+    def refresh(self):
+        valid_iscsi_ips, valid_node_ips = fs_utils.parse_valid_iscsi_info(
+            self.client.get_iscsi_portal())
+        with self._lock:
+            self._valid_iscsi_ips = valid_iscsi_ips
+            self._valid_node_ips = valid_node_ips
+            self._refresh_time = time.time()
+        return valid_iscsi_ips, valid_node_ips
+
+    def refresh_sessions(self):
+        """Replace the counted sessions by the ones the array reports."""
+        host_sessions = {}
+        for host in self.client.get_all_host():
+            host_name = host.get('hostName')
+            iscsi_ips = set(
+                session.get("iscsi_service_ip") for session in
+                self.client.get_host_iscsi_service(host_name)
+                if session.get("iscsi_service_ip"))
+            if iscsi_ips:
+                host_sessions[host_name] = iscsi_ips
+        with self._lock:
+            self._host_sessions = host_sessions
+        LOG.info("Counted iscsi sessions of %s hosts.", len(host_sessions))
+
+    def invalidate(self):
+        with self._lock:
+            self._refresh_time = None
+
+    def _is_expired(self):
+        return (self.ttl <= 0 or self._refresh_time is None or
+                time.time() - self._refresh_time > self.ttl * 2)
+
+    def get_valid_iscsi_info(self):
+        if self._is_expired():
+            return self.refresh()
+        return self._valid_iscsi_ips, self._valid_node_ips
+
+    def record_host_sessions(self, host_name, iscsi_ips):
+        with self._lock:
+            self._host_sessions[host_name] = set(iscsi_ips)
+
+    def forget_host_sessions(self, host_name, iscsi_ips=None):
+        with self._lock:
+            sessions = self._host_sessions.get(host_name)
+            if sessions is None:
+                return
+            if iscsi_ips is not None:
+                sessions.difference_update(iscsi_ips)
+            if iscsi_ips is None or not sessions:
+                self._host_sessions.pop(host_name, None)
+
+    def get_session_counts(self):
+        counts = collections.Counter()
+        with self._lock:
+            for iscsi_ips in self._host_sessions.values():
+                counts.update(iscsi_ips)
+        return counts
+
+
+class ArrayTopology(object):
+    """In-memory model of the hosts, host groups, initiators and mappings.
+
+    Hosts, host groups and initiators are listed once and reloaded every
+    ttl seconds or after mark_stale(). The hosts of a host group and the
+    hosts of a volume are loaded on first use. The client updates the model
+    after every change it makes, so an attach does not list the whole array
+    again. A ttl of 0 disables the model.
+    """
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_time = None
+        self._hosts = set()
+        self._hostgroups = set()
+        self._initiators = set()
+        self._group_hosts = {}
+        self._volume_hosts = {}
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def mark_stale(self):
+        with self._lock:
+            self._load_time = None
+
+    def reconcile(self):
+        hosts = self.client.get_all_host()
+        hostgroups = self.client.get_all_hostgroup()
+        initiators = self.client.get_all_initiator_on_array()
+        with self._lock:
+            self._hosts = set(host.get('hostName') for host in hosts)
+            self._hostgroups = set(group.get('hostGroupName')
+                                   for group in hostgroups)
+            self._initiators = set(initiator.get('portName')
+                                   for initiator in initiators)
+            self._group_hosts = {}
+            self._volume_hosts = {}
+            self._load_time = time.time()
+        LOG.info("Array topology reconciled, %(host)s hosts, %(group)s host "
+                 "groups, %(ini)s initiators.",
+                 {"host": len(self._hosts), "group": len(self._hostgroups),
+                  "ini": len(self._initiators)})
+
+    def _ensure_loaded(self):
+        if (self._load_time is None or
+                time.time() - self._load_time > self.ttl):
+            self.reconcile()
+
+    def has_host(self, host_name):
+        self._ensure_loaded()
+        return host_name in self._hosts
+
+    def has_hostgroup(self, host_group_name):
+        self._ensure_loaded()
+        return host_group_name in self._hostgroups
+
+    def has_initiator(self, initiator_name):
+        self._ensure_loaded()
+        return initiator_name in self._initiators
+
+    def get_group_hosts(self, host_group_name):
+        self._ensure_loaded()
+        if host_group_name not in self._group_hosts:
+            hosts = self.client.get_host_in_hostgroup(host_group_name)
+            with self._lock:
+                self._group_hosts[host_group_name] = set(hosts)
+        return set(self._group_hosts.get(host_group_name, ()))
+
+    def get_volume_hosts(self, vol_name):
+        self._ensure_loaded()
+        if vol_name not in self._volume_hosts:
+            hosts = self.client.get_host_by_volume(vol_name)
+            with self._lock:
+                self._volume_hosts[vol_name] = set(
+                    host.get('hostName') for host in hosts)
+        return set(self._volume_hosts.get(vol_name, ()))
+
+    def add_host(self, host_name):
+        with self._lock:
+            self._hosts.add(host_name)
+
+    def remove_host(self, host_name):
+        with self._lock:
+            self._hosts.discard(host_name)
+            for hosts in self._group_hosts.values():
+                hosts.discard(host_name)
+            for hosts in self._volume_hosts.values():
+                hosts.discard(host_name)
+
+    def add_hostgroup(self, host_group_name):
+        with self._lock:
+            self._hostgroups.add(host_group_name)
+            self._group_hosts.setdefault(host_group_name, set())
+
+    def remove_hostgroup(self, host_group_name):
+        with self._lock:
+            self._hostgroups.discard(host_group_name)
+            self._group_hosts.pop(host_group_name, None)
+
+    def add_host_to_group(self, host_group_name, host_name):
+        with self._lock:
+            if host_group_name in self._group_hosts:
+                self._group_hosts[host_group_name].add(host_name)
+
+    def remove_host_from_group(self, host_group_name, host_name):
+        with self._lock:
+            if host_group_name in self._group_hosts:
+                self._group_hosts[host_group_name].discard(host_name)
+
+    def add_initiator(self, initiator_name):
+        with self._lock:
+            self._initiators.add(initiator_name)
+
+    def remove_initiator(self, initiator_name):
+        with self._lock:
+            self._initiators.discard(initiator_name)
+
+    def map_volume(self, host_name, vol_name):
+        with self._lock:
+            if vol_name in self._volume_hosts:
+                self._volume_hosts[vol_name].add(host_name)
+
+    def unmap_volume(self, host_name, vol_name):
+        with self._lock:
+            if vol_name in self._volume_hosts:
+                self._volume_hosts[vol_name].discard(host_name)
+
+    def forget_volume(self, vol_name):
+        with self._lock:
+            self._volume_hosts.pop(vol_name, None)
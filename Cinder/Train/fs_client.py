@@ -13,16 +13,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import contextlib
+import copy
+import functools
+import itertools
 import json
+import threading
+import time
 
+import eventlet
 import requests
 import six
+from eventlet import corolocal
+from eventlet import event
+from eventlet import greenpool
+from eventlet import queue
 from oslo_log import log as logging
 from requests.adapters import HTTPAdapter
 
 from cinder import exception
 from cinder.i18n import _
 from cinder.volume.drivers.fusionstorage import constants
+from cinder.volume.drivers.fusionstorage import fs_batch
+from cinder.volume.drivers.fusionstorage import fs_cache
 
 LOG = logging.getLogger(__name__)
 
@@ -34,6 +48,22 @@ class HostNameIgnoringAdapter(HTTPAdapter):
             conn, url, verify, cert)
 
 
+def _scoped_read(func):
+    """Memoize a single argument read in the request scope of the caller."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        reads = getattr(self._request_scope, 'reads', None)
+        if reads is None:
+            return func(self, *args, **kwargs)
+        key = (func.__name__,) + args + tuple(kwargs.values())
+        if key not in reads:
+            reads[key] = func(self, *args, **kwargs)
+        else:
+            LOG.debug("Reuse the result of %s in the request scope.", key)
+        return copy.deepcopy(reads[key])
+    return wrapper
+
+
 class RestCommon(object):
     def __init__(self, fs_address, fs_user, fs_password, **extend_conf):
         self.address = fs_address
@@ -46,6 +76,28 @@ class RestCommon(object):
         self.esn = None
         self.rest_timeout = extend_conf.get(
             "rest_timeout", constants.DEFAULT_TIMEOUT)
+        self.page_fetch_workers = max(extend_conf.get(
+            "page_fetch_workers", constants.DEFAULT_PAGE_FETCH_WORKERS), 1)
+        self.volume_index = fs_cache.VolumeIndex()
+        self.snapshot_cache = fs_cache.LRUCache(
+            constants.SNAPSHOT_CACHE_SIZE, constants.SNAPSHOT_CACHE_TTL)
+        self.qos_param_cache = fs_cache.LRUCache(
+            constants.QOS_PARAM_CACHE_SIZE, constants.QOS_PARAM_CACHE_TTL)
+        self.support_snapshot_name_query = True
+        self.topology = fs_cache.ArrayTopology(
+            self, extend_conf.get("topology_cache_ttl", 0))
+        self.portal_registry = fs_cache.ISCSIPortalRegistry(
+            self, extend_conf.get("portal_cache_ttl", 0),
+            extend_conf.get("session_count_interval", 0))
+        self.delete_batcher = fs_batch.RequestBatcher(
+            extend_conf.get("delete_batch_window", 0))
+        self.failed_deletes = set()
+        self.cluster_facts_ttl = extend_conf.get(
+            "cluster_facts_ttl", constants.DEFAULT_CLUSTER_FACTS_TTL)
+        self._cluster_facts = {}
+        self._request_scope = corolocal.local()
+        self._inflight_lock = threading.Lock()
+        self._inflight_calls = {}
         mutual_authentication = extend_conf.get("mutual_authentication", {})
         self.init_http_head(mutual_authentication)
 
@@ -94,8 +146,86 @@ class RestCommon(object):
 
         return result.json() if json_flag else result
 
+    @contextlib.contextmanager
+    def request_scope(self):
+        """Memoize the volume reads of the current driver operation.
+
+        The scope belongs to the calling green thread. The reads are
+        forgotten whenever the operation sends a write request, so a read
+        is only repeated after the array may have changed. Many reads of
+        the API are POST requests, see _is_read_request.
+        """
+        if getattr(self._request_scope, 'reads', None) is not None:
+            yield
+            return
+
+        self._request_scope.reads = {}
+        try:
+            yield
+        finally:
+            self._request_scope.reads = None
+
+    def _invalidate_request_scope(self):
+        reads = getattr(self._request_scope, 'reads', None)
+        if reads:
+            reads.clear()
+
+    @staticmethod
+    def _is_read_request(url, method):
+        if method.upper() == 'GET':
+            return True
+        # The POST reads end with list or a query action, e.g. /volume/list
+        # and /iscsi/queryIscsiLinks.
+        action = url.split('?')[0].rstrip('/').rsplit('/', 1)[-1]
+        return action == 'list' or action.startswith('query')
+
     def call(self, url, method, data=None,
              call_timeout=None, **input_kwargs):
+        if not self._is_read_request(url, method):
+            self._invalidate_request_scope()
+        coalesce = input_kwargs.pop("coalesce", False)
+        if coalesce and input_kwargs.get("json_flag", True):
+            return self._coalesced_call(url, method, data, call_timeout,
+                                        **input_kwargs)
+        return self._do_call(url, method, data, call_timeout, **input_kwargs)
+
+    def _coalesced_call(self, url, method, data, call_timeout,
+                        **input_kwargs):
+        """Share one request among identical concurrent idempotent reads.
+
+        While a request with the same method, URL and body is in flight,
+        other callers wait for it and get a copy of its decoded result.
+        """
+        call_url = self._construct_url(url, input_kwargs.get("get_version"),
+                                       input_kwargs.get("get_system_time"))
+        call_key = (method.upper(), call_url, json.dumps(data, sort_keys=True))
+        with self._inflight_lock:
+            waiter = self._inflight_calls.get(call_key)
+            is_leader = waiter is None
+            if is_leader:
+                waiter = event.Event()
+                self._inflight_calls[call_key] = waiter
+
+        if not is_leader:
+            LOG.debug("Wait for the in-flight request %s.", call_url)
+            return copy.deepcopy(waiter.wait())
+
+        try:
+            result = self._do_call(url, method, data, call_timeout,
+                                   **input_kwargs)
+        except Exception as err:
+            with self._inflight_lock:
+                self._inflight_calls.pop(call_key, None)
+            waiter.send_exception(err)
+            raise
+
+        with self._inflight_lock:
+            self._inflight_calls.pop(call_key, None)
+        waiter.send(result)
+        return copy.deepcopy(result)
+
+    def _do_call(self, url, method, data=None,
+                 call_timeout=None, **input_kwargs):
         filter_flag = input_kwargs.get("filter_flag")
         json_flag = input_kwargs.get("json_flag", True)
         get_version = input_kwargs.get("get_version")
@@ -172,6 +302,38 @@ class RestCommon(object):
             "x-auth-token": self.token
         })
         self.esn = self.get_esn()
+        self._load_cluster_facts()
+
+    def _get_cluster_fact_queries(self):
+        return {
+            "fsm_version": self._query_fsm_version,
+            "time_zone": self._query_system_time_zone,
+            "time_config": self._query_time_config,
+        }
+
+    def _load_cluster_facts(self):
+        """Read the cluster settings used by the QoS conversion.
+
+        A setting that can not be read now is read again when it is used.
+        """
+        self._cluster_facts = {}
+        if self.cluster_facts_ttl <= 0:
+            return
+        for name, query in self._get_cluster_fact_queries().items():
+            try:
+                self._cluster_facts[name] = (query(), time.time())
+            except Exception as err:
+                LOG.warning("Load cluster fact %(name)s failed. "
+                            "Reason: %(err)s", {"name": name, "err": err})
+
+    def _get_cluster_fact(self, name):
+        fact = self._cluster_facts.get(name)
+        if (fact is None or self.cluster_facts_ttl <= 0 or
+                time.time() - fact[1] > self.cluster_facts_ttl):
+            query = self._get_cluster_fact_queries()[name]
+            fact = (query(), time.time())
+            self._cluster_facts[name] = fact
+        return fact[0]
 
     def logout(self):
         url = '/sec/logout'
@@ -228,21 +390,98 @@ class RestCommon(object):
             result, "Query all volume session error")
         return result.get('volumeList')
 
-    def get_volume_by_id(self, pool_id, vol_id):
+    @staticmethod
+    def _get_page_count(total_num, page_size):
+        return (int(total_num) + page_size - 1) // page_size
+
+    def _fetch_pages(self, fetch_page, page_nums):
+        """Fetch the pages concurrently and yield them as they arrive.
+
+        At most page_fetch_workers requests are in flight at a time. If the
+        caller stops iterating, the pages not yet requested are skipped.
+        """
+        results = queue.LightQueue()
+        pool = greenpool.GreenPool(self.page_fetch_workers)
+
+        def _fetch(page_num):
+            try:
+                results.put((page_num, fetch_page(page_num), None))
+            except Exception as err:
+                results.put((page_num, None, err))
+
+        pending = iter(page_nums)
+        in_flight = 0
+        for page_num in itertools.islice(pending, self.page_fetch_workers):
+            pool.spawn_n(_fetch, page_num)
+            in_flight += 1
+
+        while in_flight:
+            page_num, page_result, err = results.get()
+            in_flight -= 1
+            if err is not None:
+                raise err
+
+            next_page = next(pending, None)
+            if next_page is not None:
+                pool.spawn_n(_fetch, next_page)
+                in_flight += 1
+            yield page_num, page_result
+
+    def list_pool_volumes(self, pool_id):
+        """Read all volumes of the pool, the volume index is reloaded too."""
         vol_cnt = self._get_volume_num_by_pool(pool_id)
         page_num = constants.GET_VOLUME_PAGE_NUM
         page_size = constants.GET_VOLUME_PAGE_SIZE
-        while vol_cnt > 0:
-            vol_list = self._query_volumes_by_batch(pool_id, page_num,
-                                                    page_size)
-            for vol_info in vol_list:
-                if int(vol_info.get('volId')) == int(vol_id):
-                    return vol_info
-
-            vol_cnt -= page_size
-            page_num += 1
+        page_count = self._get_page_count(vol_cnt, page_size)
+
+        def _fetch_volume_page(num):
+            return self._query_volumes_by_batch(pool_id, num, page_size)
+
+        all_volumes = []
+        for __, vol_list in self._fetch_pages(
+                _fetch_volume_page, range(page_num, page_num + page_count)):
+            all_volumes.extend(vol_list or [])
+        self.volume_index.load(pool_id, all_volumes)
+        return all_volumes
+
+    def _get_indexed_volume(self, pool_id, vol_id):
+        vol_info = self.volume_index.get_by_id(pool_id, vol_id)
+        if not vol_info:
+            return None
+
+        # Make sure the indexed volume has not been deleted or renamed
+        # outside of OpenStack, this is a point query by name.
+        vol_name = vol_info.get('volName')
+        current_info = self.query_volume_by_name(vol_name)
+        if current_info and str(current_info.get('volId')) == str(vol_id):
+            return current_info
+
+        self.volume_index.remove(vol_name)
         return None
 
+    def get_volume_by_id(self, pool_id, vol_id):
+        """Find a volume by id, the pool is scanned as the last resort.
+
+        The point query by id is tried once, when it fails the volume index
+        is consulted and at last all volumes of the pool are read, which
+        also reloads the index. The volume found by the point query may
+        belong to another pool.
+        """
+        try:
+            return self.query_volume_by_id(vol_id)
+        except Exception as err:
+            LOG.warning("Query volume %(id)s by id failed, look it up in "
+                        "pool %(pool)s. Reason: %(err)s",
+                        {"id": vol_id, "pool": pool_id, "err": err})
+
+        vol_info = self._get_indexed_volume(pool_id, vol_id)
+        if vol_info:
+            return vol_info
+
+        # The volume may have been created after the pool was indexed.
+        self.list_pool_volumes(pool_id)
+        return self.volume_index.get_by_id(pool_id, vol_id)
+
     def _query_snapshot_of_volume_batch(self, vol_name, snapshot_name,
                                         batch_num=1, batch_limit=1000):
         url = '/volume/snapshot/list'
@@ -263,29 +502,48 @@ class RestCommon(object):
                 return res
         return None
 
-    def query_snapshots_of_volume(self, vol_name, snapshot_name):
+    def _search_snapshot_pages(self, query_batch, snapshot_key,
+                               snapshot_name):
         batch_num = constants.GET_SNAPSHOT_PAGE_NUM
         batch_size = constants.GET_SNAPSHOT_PAGE_SIZE
-        while True:
-            batch_result = self._query_snapshot_of_volume_batch(
-                vol_name, snapshot_name, batch_num, batch_size)
+        batch_result = query_batch(batch_num, batch_size)
+        snapshot_info = self._get_snapshot_from_result(
+            batch_result, snapshot_key, snapshot_name)
+        if snapshot_info or batch_result.get('totalNum') < batch_size:
+            return snapshot_info
+
+        # The first page tells how many pages exist, fetch the rest at once.
+        page_count = self._get_page_count(
+            batch_result.get('totalNum'), batch_size)
+        other_pages = range(batch_num + 1, batch_num + page_count)
+        for __, batch_result in self._fetch_pages(
+                lambda num: query_batch(num, batch_size), other_pages):
             snapshot_info = self._get_snapshot_from_result(
-                batch_result, 'snapshotName', snapshot_name)
+                batch_result, snapshot_key, snapshot_name)
             if snapshot_info:
                 return snapshot_info
-            if batch_result.get('totalNum') < batch_size:
-                break
-            batch_num += 1
         return None
 
+    def query_snapshots_of_volume(self, vol_name, snapshot_name):
+        def _query_batch(batch_num, batch_size):
+            return self._query_snapshot_of_volume_batch(
+                vol_name, snapshot_name, batch_num, batch_size)
+
+        return self._search_snapshot_pages(
+            _query_batch, 'snapshotName', snapshot_name)
+
+    @_scoped_read
     def query_volume_by_name(self, vol_name):
         url = ('/volume/queryByName?volName=%(vol_name)s' % {'vol_name': vol_name})
         result = self.call(url, 'GET')
         if result.get('errorCode') in constants.VOLUME_NOT_EXIST:
+            self.volume_index.remove(vol_name)
             return None
         self._assert_rest_result(
             result, _("Query volume by name session error"))
-        return result.get('lunDetailInfo')
+        vol_info = result.get('lunDetailInfo')
+        self.volume_index.add(vol_info)
+        return vol_info
 
     def query_volume_by_name_v2(self, vol_name):
         url = ('/api/v2/block_service/volumes?name=%(vol_name)s' % {'vol_name': vol_name})
@@ -296,6 +554,7 @@ class RestCommon(object):
             result, _("Query volume by name session error"))
         return result.get('data', {})
 
+    @_scoped_read
     def query_volume_by_id(self, vol_id):
         url = ('v1.3/volume/queryById?volId=%(vol_id)s' % {'vol_id': vol_id})
         result = self.call(url, 'GET', get_version=True)
@@ -308,18 +567,133 @@ class RestCommon(object):
     def create_volume(self, vol_name, vol_size, pool_id):
         url = '/volume/create'
         params = {"volName": vol_name, "volSize": vol_size, "poolId": pool_id}
+        self.volume_index.remove(vol_name)
         result = self.call(url, "POST", params)
         self._assert_rest_result(result, _('Create volume session error.'))
 
-    def delete_volume(self, vol_name):
+    def delete_volume(self, vol_name, wait=True):
+        """Delete the volume together with others deleted at the same time.
+
+        With wait set to False the volume is deleted in the background. A
+        failed delete is retried a few times, then the volume is kept in
+        failed_deletes until retry_failed_deletes() is called.
+        """
+        # The batch may be sent by another green thread.
+        self._invalidate_request_scope()
+        if not wait:
+            eventlet.spawn_n(self._delete_volume_in_background, vol_name)
+            return None
+        return self.delete_batcher.submit(
+            'volume_delete', vol_name, self._delete_volume_batch)
+
+    def _delete_volume_in_background(self, vol_name):
+        for attempt in range(constants.DELETE_VOLUME_RETRIES + 1):
+            if attempt:
+                eventlet.sleep(constants.DELETE_VOLUME_RETRY_INTERVAL *
+                               2 ** (attempt - 1))
+            try:
+                self.delete_volume(vol_name)
+                return
+            except Exception as err:
+                LOG.warning("Delete volume %(name)s in background failed, "
+                            "attempt %(attempt)s. Reason: %(err)s",
+                            {"name": vol_name, "attempt": attempt + 1,
+                             "err": err})
+
+        LOG.error("Delete volume %s in background failed, keep it for a "
+                  "later retry.", vol_name)
+        self.failed_deletes.add(vol_name)
+
+    def retry_failed_deletes(self):
+        """Delete again the volumes whose background delete failed."""
+        for vol_name in list(self.failed_deletes):
+            self.failed_deletes.discard(vol_name)
+            eventlet.spawn_n(self._delete_volume_in_background, vol_name)
+
+    def _delete_volume_batch(self, close_batch):
+        vol_names = list(collections.OrderedDict.fromkeys(close_batch()))
+        batch_size = constants.DELETE_VOLUME_BATCH_SIZE
+        results = {}
+        for index in range(0, len(vol_names), batch_size):
+            results.update(self.delete_volumes(
+                vol_names[index:index + batch_size]))
+        return results
+
+    def _delete_single_volume(self, vol_name):
         url = '/volume/delete'
         params = {"volNames": [vol_name]}
         result = self.call(url, "POST", params)
         if result.get('errorCode') in constants.VOLUME_NOT_EXIST:
+            self.volume_index.remove(vol_name)
             return None
         self._assert_rest_result(result, _('Delete volume session error.'))
+        self.volume_index.remove(vol_name)
+        self.topology.forget_volume(vol_name)
         return None
 
+    @staticmethod
+    def _get_delete_errors(result, vol_names):
+        """Return the error code of each volume that failed to be deleted.
+
+        Return None if the failures can not be matched to the volume names.
+        """
+        status = result.get('result')
+        if isinstance(status, dict):
+            status = status.get('code')
+        if status == 0:
+            return {}
+        if status != constants.DSWARE_MULTI_ERROR:
+            return None
+
+        errors = {}
+        for err in result.get("detail", []):
+            vol_name = err.get('volName') or err.get('name')
+            if vol_name not in vol_names:
+                return None
+            errors[vol_name] = err.get('errorCode')
+        return errors
+
+    def delete_volumes(self, vol_names):
+        """Delete the volumes in one request.
+
+        Return the result of each volume, None if it was deleted or the
+        exception of its failure.
+        """
+        if len(vol_names) > 1:
+            url = '/volume/delete'
+            params = {"volNames": vol_names}
+            result = self.call(url, "POST", params)
+            errors = self._get_delete_errors(result, vol_names)
+            if errors is not None:
+                return self._get_delete_results(vol_names, errors, result)
+            LOG.warning("Delete volumes %(names)s failed without a result "
+                        "per volume, delete them one by one. result: "
+                        "%(res)s", {"names": vol_names, "res": result})
+
+        results = {}
+        for vol_name in vol_names:
+            try:
+                results[vol_name] = self._delete_single_volume(vol_name)
+            except Exception as err:
+                results[vol_name] = err
+        return results
+
+    def _get_delete_results(self, vol_names, errors, result):
+        results = {}
+        for vol_name in vol_names:
+            error_code = errors.get(vol_name)
+            if error_code is None or error_code in constants.VOLUME_NOT_EXIST:
+                self.volume_index.remove(vol_name)
+                self.topology.forget_volume(vol_name)
+                results[vol_name] = None
+                continue
+
+            msg = (_('Delete volume %(name)s session error.\nresult: '
+                     '%(res)s.') % {'name': vol_name, 'res': result})
+            LOG.error(msg)
+            results[vol_name] = exception.VolumeBackendAPIException(data=msg)
+        return results
+
     def attach_volume(self, vol_name, manage_ip):
         url = '/volume/attach'
         params = {"volName": [vol_name], "ipList": [manage_ip]}
@@ -359,29 +733,61 @@ class RestCommon(object):
         return result
 
     def query_snapshot_by_name(self, pool_id, snapshot_name):
-        batch_num = constants.GET_SNAPSHOT_PAGE_NUM
-        batch_size = constants.GET_SNAPSHOT_PAGE_SIZE
-        while True:
-            batch_result = self._query_snapshot_by_name_batch(
+        def _query_batch(batch_num, batch_size):
+            return self._query_snapshot_by_name_batch(
                 pool_id, snapshot_name, batch_num, batch_size)
-            snapshot_info = self._get_snapshot_from_result(
-                batch_result, 'snapName', snapshot_name)
+
+        return self._search_snapshot_pages(
+            _query_batch, 'snapName', snapshot_name)
+
+    def get_snapshot_by_name(self, pool_id, snapshot_name, cached=True):
+        """Resolve a snapshot by name with a point query.
+
+        Results are kept in a short lived LRU cache which is invalidated
+        when the driver creates or deletes the snapshot, pass cached=False
+        to check the array before operating on the snapshot. Storage
+        without the v2 snapshot query falls back to paging the snapshot
+        list of the pool.
+        """
+        if cached:
+            snapshot_info = self.snapshot_cache.get(snapshot_name)
             if snapshot_info:
                 return snapshot_info
-            if batch_result.get('totalNum') < batch_size:
-                break
-            batch_num += 1
-        return None
+
+        if self.support_snapshot_name_query:
+            try:
+                snapshot_info = self.get_snapshot_info_by_name(
+                    snapshot_name, allow_not_exist=True)
+                if snapshot_info:
+                    snapshot_info.setdefault(
+                        'snapName', snapshot_info.get('name'))
+            except Exception as err:
+                if constants.URL_NOT_FOUND not in six.text_type(err):
+                    raise
+                LOG.info("The storage does not support querying snapshot by "
+                         "name, query the snapshot list instead.")
+                self.support_snapshot_name_query = False
+
+        if not self.support_snapshot_name_query:
+            snapshot_info = self.query_snapshot_by_name(pool_id, snapshot_name)
+
+        if snapshot_info:
+            self.snapshot_cache.set(snapshot_name, snapshot_info)
+        else:
+            self.snapshot_cache.pop(snapshot_name)
+        return snapshot_info
 
     def create_snapshot(self, snapshot_name, vol_name):
         url = '/snapshot/create'
         params = {"volName": vol_name, "snapshotName": snapshot_name}
+        self.snapshot_cache.pop(snapshot_name)
         result = self.call(url, "POST", params)
         self._assert_rest_result(result, _('Create snapshot error.'))
 
     def delete_snapshot(self, snapshot_name):
         url = '/snapshot/delete'
         params = {"snapshotName": snapshot_name}
+        self.snapshot_cache.pop(snapshot_name)
         result = self.call(url, "POST", params)
         if result.get('errorCode') in constants.SNAPSHOT_NOT_EXIST:
             return
@@ -417,11 +823,29 @@ class RestCommon(object):
             return False
         return True
 
+    @staticmethod
+    def _has_detail_error(result, detail_error_code):
+        if result.get("result", "") != constants.DSWARE_MULTI_ERROR:
+            return False
+        return any(err.get("errorCode") == detail_error_code
+                   for err in result.get("detail", []))
+
+    def _check_topology_conflict(self, result, detail_error_code):
+        # The array already had the object we believed missing, the
+        # topology model is out of date and is reloaded on next use.
+        if self._has_detail_error(result, detail_error_code):
+            LOG.info("Array topology is out of date, error code %s.",
+                     detail_error_code)
+            self.topology.mark_stale()
+
     def create_host(self, host_name):
         url = '/host/create'
         params = {"hostName": host_name}
         result = self.call(url, "POST", params)
         if self._is_detail_error(result, constants.HOST_ALREADY_EXIST):
+            self.topology.add_host(host_name)
+            self._check_topology_conflict(
+                result, constants.HOST_ALREADY_EXIST)
             return None
 
         self._assert_rest_result(result, _('Create host session error.'))
@@ -432,6 +856,10 @@ class RestCommon(object):
         params = {"hostName": host_name}
         result = self.call(url, "POST", params)
         if self._is_detail_error(result, constants.HOST_MAPPING_EXIST):
+            if self._has_detail_error(result, constants.HOST_MAPPING_EXIST):
+                self.topology.mark_stale()
+            else:
+                self.topology.remove_host(host_name)
             return None
 
         self._assert_rest_result(result, _('Delete host session error.'))
@@ -439,7 +867,7 @@ class RestCommon(object):
 
     def get_all_host(self):
         url = '/host/list'
-        result = self.call(url, "GET")
+        result = self.call(url, "GET", coalesce=True)
         self._assert_rest_result(result, _('Get all host session error'))
         return result.get("hostList", [])
 
@@ -452,11 +880,16 @@ class RestCommon(object):
         return result.get("hostList", [])
 
     def map_volume_to_host(self, host_name, vol_name):
+        self.map_volumes_to_host(host_name, [vol_name])
+
+    def map_volumes_to_host(self, host_name, vol_names):
         url = '/host/lun/add'
-        params = {"hostName": host_name, "lunNames": [vol_name]}
+        params = {"hostName": host_name, "lunNames": vol_names}
         result = self.call(url, "POST", params)
         self._assert_rest_result(
             result, _("Map volumes to host session error"))
+        for vol_name in vol_names:
+            self.topology.map_volume(host_name, vol_name)
 
     def unmap_volume_from_host(self, host_name, vol_name):
         url = '/host/lun/delete'
@@ -464,6 +897,7 @@ class RestCommon(object):
         result = self.call(url, "POST", params)
         self._assert_rest_result(
             result, _("Unmap volumes from host session error"))
+        self.topology.unmap_volume(host_name, vol_name)
 
     def get_host_lun(self, host_name):
         url = '/host/lun/list'
@@ -486,6 +920,9 @@ class RestCommon(object):
         params = {"hostGroupName": host_group_name}
         result = self.call(url, "POST", params)
         if self._is_detail_error(result, constants.HOSTGROUP_ALREADY_EXIST):
+            self.topology.add_hostgroup(host_group_name)
+            self._check_topology_conflict(
+                result, constants.HOSTGROUP_ALREADY_EXIST)
             return None
         self._assert_rest_result(result, _("Create HostGroup session error"))
         return None
@@ -496,10 +933,11 @@ class RestCommon(object):
         result = self.call(url, "POST", params)
         self._assert_rest_result(
             result, _("Delete HostGroup session error"))
+        self.topology.remove_hostgroup(host_group_name)
 
     def get_all_hostgroup(self):
         url = '/hostGroup/list'
-        result = self.call(url, "GET")
+        result = self.call(url, "GET", coalesce=True)
         self._assert_rest_result(result, _("Get HostGroup session error"))
         return result.get("groupList", [])
 
@@ -509,12 +947,16 @@ class RestCommon(object):
         result = self.call(url, "POST", params)
         if self._is_detail_error(result, constants.HOST_MAPPING_GROUP_EXIST):
             LOG.error("The host: %s has already in HostGroup: %s", host_name, host_group_name)
+            self.topology.add_host_to_group(host_group_name, host_name)
+            self._check_topology_conflict(
+                result, constants.HOST_MAPPING_GROUP_EXIST)
             return None
 
         if self._is_detail_error(result, constants.HOST_ALREADY_MAPPING_LUN):
             all_host = self.get_host_in_hostgroup(host_group_name)
             if host_name in all_host:
                 LOG.error("The host: %s has already in HostGroup: %s", host_name, host_group_name)
+                self.topology.add_host_to_group(host_group_name, host_name)
                 return None
 
             msg = ("Add host to host group error, The host %s has already mapping lun "
@@ -531,6 +973,7 @@ class RestCommon(object):
         result = self.call(url, "POST", params)
         self._assert_rest_result(
             result, _("Delete host from HostGroup session error"))
+        self.topology.remove_host_from_group(host_group_name, host_name)
 
     def get_host_in_hostgroup(self, host_group_name):
         url = '/hostGroup/host/list'
@@ -543,7 +986,7 @@ class RestCommon(object):
     def get_all_initiator_on_array(self):
         url = '/port/list'
         params = {}
-        result = self.call(url, "POST", params)
+        result = self.call(url, "POST", params, coalesce=True)
         self._assert_rest_result(
             result, _("Get all initiator on array session error"))
         return result.get("portList", [])
@@ -553,6 +996,9 @@ class RestCommon(object):
         params = {"portName": initiator_name}
         result = self.call(url, "POST", params, get_version=True)
         if self._is_detail_error(result, constants.INITIATOR_ALREADY_EXIST):
+            self.topology.add_initiator(initiator_name)
+            self._check_topology_conflict(
+                result, constants.INITIATOR_ALREADY_EXIST)
             return None
         self._assert_rest_result(result, _("Add initiator to array session error"))
         return None
@@ -563,6 +1009,7 @@ class RestCommon(object):
         result = self.call(url, "POST", params, get_version=True)
         self._assert_rest_result(
             result, _("Remove initiator from array session error"))
+        self.topology.remove_initiator(initiator_name)
 
     def add_initiator_to_host(self, host_name, initiator):
         url = '/host/port/add'
@@ -659,13 +1106,22 @@ class RestCommon(object):
         return result.get("volumes", [])
 
     def get_fsm_version(self):
+        return self._get_cluster_fact("fsm_version")
+
+    def get_system_time_zone(self):
+        return self._get_cluster_fact("time_zone")
+
+    def get_time_config(self):
+        return copy.deepcopy(self._get_cluster_fact("time_config"))
+
+    def _query_fsm_version(self):
         url = "/version"
         result = self.call(url, "GET")
         self._assert_rest_result(
             result, _("Get FSM version session error."))
         return result.get("version")
 
-    def get_system_time_zone(self):
+    def _query_system_time_zone(self):
         url = "/time/querytimezone"
         result = self.call(url, "GET")
         self._assert_rest_result(
@@ -673,7 +1129,7 @@ class RestCommon(object):
 
         return result.get("timeZone")
 
-    def get_time_config(self):
+    def _query_time_config(self):
         url = "/api/v2/common/time_config"
         result = self.call(url, "GET", get_system_time=True)
         if result.get('result', {}).get("code") != 0:
@@ -685,10 +1141,13 @@ class RestCommon(object):
             return result.get("data")[0]
         return {}
 
-    def get_snapshot_info_by_name(self, snapshot_name):
+    def get_snapshot_info_by_name(self, snapshot_name, allow_not_exist=False):
         url = "/api/v2/block_service/snapshots"
         params = {"name": snapshot_name}
         result = self.call(url, "GET", params, get_system_time=True)
+        if (allow_not_exist and isinstance(result.get('result'), dict) and
+                result['result'].get('code') in constants.SNAPSHOT_NOT_EXIST):
+            return {}
         self._assert_rest_result(
             result, _("Get snapshot info session error."))
         return result.get("data", {})
@@ -715,7 +1174,8 @@ class RestCommon(object):
 
     def get_iscsi_portal(self):
         url = "/dsware/service/cluster/dswareclient/queryIscsiPortal"
-        result = self.call(url, "POST", data={}, get_system_time=True)
+        result = self.call(url, "POST", data={}, get_system_time=True,
+                           coalesce=True)
         self._assert_rest_result(
             result, _("Get ISCSI portal session error."))
         return result.get("nodeResultList", [])
@@ -741,6 +1201,7 @@ class RestCommon(object):
                 if result:
                     return None
             self._assert_rest_result(result, _("Add iscsi host relation session error."))
+            self.portal_registry.record_host_sessions(host_name, ip_list)
             return None
         except Exception as err:
             if constants.URL_NOT_FOUND in six.text_type(err):
@@ -782,6 +1243,7 @@ class RestCommon(object):
             result = self.call(url, "POST", params, get_system_time=True)
             self._assert_rest_result(
                 result, _("Delete iscsi host relation session error."))
+            self.portal_registry.forget_host_sessions(host_name, ip_list)
             return True
         except Exception as err:
             if constants.URL_NOT_FOUND in six.text_type(err):
@@ -852,6 +1314,8 @@ class RestCommon(object):
 
     def create_consistent_snapshot_by_name(self, snapshot_group_list):
         url = "/api/v2/block_service/consistency_snapshots"
+        for snapshot in snapshot_group_list:
+            self.snapshot_cache.pop(snapshot.get('name'))
         result = self.call(url, "POST", snapshot_group_list, get_system_time=True)
         self._assert_rest_result(result, _("create consistent_snapshot error."))
         return result.get('data', [])
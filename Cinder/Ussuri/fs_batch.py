@@ -0,0 +1,104 @@
+# Copyright (c) 2025 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import threading
+
+import eventlet
+from eventlet import event
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class _Batch(object):
+    def __init__(self):
+        self.items = []
+        self.done = event.Event()
+
+
+class RequestBatcher(object):
+    """Groups requests with the same key that arrive close together.
+
+    The first request of a key becomes the leader of a new batch. The
+    leader runs at once when no batch of the key is running, otherwise it
+    waits for the running batch to finish. It then waits for the optional
+    batch window and calls the handler with a function that closes the
+    batch and returns its items. Requests submitted before the batch is
+    closed join it. The handler returns a result per item; a result that
+    is an exception is raised to the caller of that item only.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._running = {}
+
+    def submit(self, key, item, handler):
+        with self._lock:
+            batch = self._pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = _Batch()
+                self._pending[key] = batch
+                running = self._running.get(key)
+            batch.items.append(item)
+
+        if is_leader:
+            if running is not None:
+                self._wait_running(running)
+            if self.window > 0:
+                eventlet.sleep(self.window)
+            self._run(key, batch, handler)
+
+        result = batch.done.wait().get(item)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    @staticmethod
+    def _wait_running(batch):
+        try:
+            batch.done.wait()
+        except Exception:
+            pass
+
+    def _close(self, key, batch):
+        with self._lock:
+            if self._pending.get(key) is batch:
+                self._pending.pop(key)
+            items = list(batch.items)
+        LOG.info("Run batch %(key)s with %(num)s request(s).",
+                 {"key": key, "num": len(items)})
+        return items
+
+    def _run(self, key, batch, handler):
+        with self._lock:
+            self._running[key] = batch
+        try:
+            results = handler(lambda: self._close(key, batch))
+        except Exception as err:
+            self._close(key, batch)
+            self._finish(key, batch)
+            batch.done.send_exception(err)
+        else:
+            self._finish(key, batch)
+            batch.done.send(results)
+
+    def _finish(self, key, batch):
+        with self._lock:
+            if self._running.get(key) is batch:
+                self._running.pop(key)
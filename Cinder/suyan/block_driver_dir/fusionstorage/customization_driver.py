@@ -40,18 +40,19 @@ class DriverForPlatform(object):
             self.fs_qos.remove(volume_name)
             return
 
+        qos_specs = fs_utils.get_static_qos_param(qos_vals)
         qos_vals = fs_utils.get_qos_param(qos_vals, self.client)
         vol_qos = self.client.get_qos_by_vol_name(volume_name)
         qos_name = vol_qos.get("qosName")
         if qos_name:
             LOG.info("volume already had qos, "
                      "update qos:%s of volume %s", qos_name, volume_name)
-            self.client.modify_qos(qos_name, qos_vals)
+            self.fs_qos.update(qos_vals, volume_name, qos_name, qos_specs)
             return
 
         LOG.info("volume did not have qos, "
                  "add qos to volume %s", volume_name)
-        self.fs_qos.add(qos_vals, volume_name)
+        self.fs_qos.add(qos_vals, volume_name, qos_specs)
         return
 
     def modify_qos_with_volume(self, qos_id, volume):
@@ -75,7 +76,8 @@ class DriverForPlatform(object):
                       'qos_id': qos_id, 'volume': volume_name}
             self._raise_exception(msg)
 
-        self.client.modify_qos(qos_name, new_qos)
+        self.fs_qos.update(new_qos, volume_name, qos_name,
+                           fs_utils.get_static_qos_specs(qos_id))
 
     def rollback_snapshot(self, volume, snapshot):
         """
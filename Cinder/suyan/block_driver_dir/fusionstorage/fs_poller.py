@@ -0,0 +1,279 @@
+# Copyright (c) 2025 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import collections
+import random
+import threading
+import time
+
+from eventlet import event
+from eventlet import greenpool
+from oslo_log import log as logging
+from oslo_service import loopingcall
+
+from cinder import exception
+from cinder.i18n import _
+from cinder.volume.drivers.fusionstorage import constants
+
+LOG = logging.getLogger(__name__)
+
+
+class FixedSchedule(object):
+    """Poll at the same interval every time."""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def next_interval(self, progress=None):
+        return self.interval
+
+
+class ExponentialSchedule(object):
+    """Start fast and double the interval up to maximum, with jitter."""
+
+    def __init__(self, initial, maximum, jitter=constants.POLL_JITTER):
+        self.maximum = maximum
+        self.jitter = jitter
+        self._interval = min(initial, maximum)
+
+    def next_interval(self, progress=None):
+        interval = self._interval
+        self._interval = min(self._interval * 2, self.maximum)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class ProgressSchedule(object):
+    """Poll when the operation is predicted to finish.
+
+    The finish time is predicted from the rate at which the reported
+    progress percentage grows. Without progress the schedule backs off
+    exponentially.
+    """
+
+    def __init__(self, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._fallback = ExponentialSchedule(minimum, maximum)
+        self._last = None
+
+    def next_interval(self, progress=None):
+        try:
+            progress = float(progress)
+        except (TypeError, ValueError):
+            return self._fallback.next_interval()
+
+        now = time.time()
+        last, self._last = self._last, (now, progress)
+        if last is None or progress <= last[1] or now <= last[0]:
+            return self._fallback.next_interval()
+
+        rate = (progress - last[1]) / (now - last[0])
+        remaining = (constants.POLL_PROGRESS_FINISH - progress) / rate
+        return min(max(remaining, self.minimum), self.maximum)
+
+
+class CappedSchedule(object):
+    """Limit the intervals of another schedule to maximum."""
+
+    def __init__(self, schedule, maximum):
+        self.schedule = schedule
+        self.maximum = maximum
+
+    def next_interval(self, progress=None):
+        return min(self.schedule.next_interval(progress), self.maximum)
+
+
+def create_schedule(kind, interval):
+    """Return a new schedule of the kind for an operation.
+
+    interval is the fixed interval the operation used to be polled at,
+    the other schedules start at POLL_MIN_INTERVAL and back off from there.
+    """
+    minimum = min(constants.POLL_MIN_INTERVAL, interval)
+    maximum = interval * constants.POLL_MAX_FACTOR
+    if kind == constants.POLL_SCHEDULE_EXPONENTIAL:
+        return ExponentialSchedule(minimum, maximum)
+    if kind == constants.POLL_SCHEDULE_PROGRESS:
+        return ProgressSchedule(minimum, maximum)
+    if kind == constants.POLL_SCHEDULE_CAPPED:
+        return CappedSchedule(ExponentialSchedule(minimum, interval), interval)
+    return FixedSchedule(interval)
+
+
+class _Waiter(object):
+    def __init__(self, name, fetch, predicate, schedule, timeout, op_type,
+                 progress):
+        self.name = name
+        self.fetch = fetch
+        self.predicate = predicate
+        self.schedule = schedule
+        self.op_type = op_type
+        self.progress = progress
+        self.polls = 0
+        self.start_time = time.time()
+        self.deadline = self.start_time + timeout
+        self.next_poll = self.start_time
+        self.vol_name = None
+        self.pool_id = None
+        self.result = event.Event()
+
+
+class StatusPoller(object):
+    """One poll loop for all the volumes and tasks the driver waits for.
+
+    A waiter registers how to read its object, a predicate and a deadline,
+    and gets an event back. The event is sent with the object once the
+    predicate returns true, or with the exception raised by the read or the
+    predicate, or with a timeout error after the deadline.
+
+    Volume waiters of the same storage pool are read with one scan of the
+    pool when that takes fewer requests than querying them one by one, the
+    other waiters are read concurrently by a few green threads, so a slow
+    read does not hold up the rest. The loop only runs while there are
+    waiters.
+    """
+
+    def __init__(self, client, tick=constants.STATUS_POLL_TICK):
+        self.client = client
+        self.tick = tick
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._pool_pages = {}
+        self._timer = None
+        self._metrics = collections.defaultdict(
+            lambda: {"completed": 0, "failed": 0, "polls": 0})
+
+    def watch(self, fetch, schedule, timeout, predicate=bool,
+              op_type=constants.POLL_OP_DEFAULT, progress=None, name=None):
+        waiter = _Waiter(name or getattr(fetch, '__name__', 'fetch'), fetch,
+                         predicate, schedule, timeout, op_type, progress)
+        self._add(waiter)
+        return waiter.result
+
+    def watch_volume(self, vol_name, pool_id, predicate, schedule, timeout,
+                     op_type=constants.POLL_OP_DEFAULT):
+        waiter = _Waiter(vol_name,
+                         lambda: self.client.query_volume_by_name(vol_name),
+                         predicate, schedule, timeout, op_type, None)
+        waiter.vol_name = vol_name
+        waiter.pool_id = pool_id
+        self._add(waiter)
+        return waiter.result
+
+    def _add(self, waiter):
+        with self._lock:
+            self._waiters.append(waiter)
+            if self._timer is None:
+                self._timer = loopingcall.FixedIntervalLoopingCall(self._poll)
+                self._timer.start(interval=self.tick)
+
+    def _poll(self):
+        now = time.time()
+        with self._lock:
+            due = [waiter for waiter in self._waiters
+                   if waiter.next_poll <= now]
+
+        volume_infos = self._scan_pools(due)
+        pool = greenpool.GreenPool(constants.STATUS_POLL_WORKERS)
+        for waiter in due:
+            pool.spawn_n(self._check, waiter, volume_infos)
+        pool.waitall()
+
+        with self._lock:
+            self._waiters = [waiter for waiter in self._waiters
+                             if not waiter.result.ready()]
+            if not self._waiters:
+                self._timer = None
+                raise loopingcall.LoopingCallDone()
+
+    def _scan_pools(self, waiters):
+        pool_waiters = collections.defaultdict(list)
+        for waiter in waiters:
+            if waiter.vol_name and waiter.pool_id is not None:
+                pool_waiters[waiter.pool_id].append(waiter)
+
+        volume_infos = {}
+        for pool_id, waiters in pool_waiters.items():
+            # A scan costs one request per page plus one for the volume
+            # count of the pool.
+            if len(waiters) <= self._pool_pages.get(pool_id, 1) + 1:
+                continue
+            try:
+                all_volumes = self.client.list_pool_volumes(pool_id)
+            except Exception as err:
+                LOG.warning("Scan volumes of pool %(pool)s failed, query "
+                            "them one by one. Reason: %(err)s",
+                            {"pool": pool_id, "err": err})
+                continue
+
+            page_size = constants.GET_VOLUME_PAGE_SIZE
+            self._pool_pages[pool_id] = max(
+                (len(all_volumes) + page_size - 1) // page_size, 1)
+            by_name = dict((vol_info.get('volName'), vol_info)
+                           for vol_info in all_volumes)
+            for waiter in waiters:
+                volume_infos[waiter.vol_name] = by_name.get(waiter.vol_name)
+        return volume_infos
+
+    def _finish(self, waiter, succeeded):
+        with self._lock:
+            metrics = self._metrics[waiter.op_type]
+            metrics["completed" if succeeded else "failed"] += 1
+            metrics["polls"] += waiter.polls
+        LOG.info("Wait for %(op)s %(name)s %(result)s after %(polls)s "
+                 "poll(s) in %(t).1f second(s).",
+                 {"op": waiter.op_type, "name": waiter.name,
+                  "result": "finished" if succeeded else "failed",
+                  "polls": waiter.polls,
+                  "t": time.time() - waiter.start_time})
+
+    def get_metrics(self):
+        """Return the poll counts and polls per operation by type."""
+        with self._lock:
+            metrics = dict((op_type, dict(values))
+                           for op_type, values in self._metrics.items())
+        for values in metrics.values():
+            finished = values["completed"] + values["failed"]
+            values["polls_per_operation"] = (
+                float(values["polls"]) / finished if finished else 0)
+        return metrics
+
+    def _check(self, waiter, volume_infos):
+        waiter.polls += 1
+        try:
+            if waiter.vol_name in volume_infos:
+                current = volume_infos[waiter.vol_name]
+            else:
+                current = waiter.fetch()
+            if waiter.predicate(current):
+                self._finish(waiter, True)
+                waiter.result.send(current)
+                return
+            progress = waiter.progress(current) if waiter.progress else None
+        except Exception as err:
+            self._finish(waiter, False)
+            waiter.result.send_exception(err)
+            return
+
+        if time.time() > waiter.deadline:
+            msg = _('Wait for %s timed out.') % waiter.name
+            LOG.error(msg)
+            self._finish(waiter, False)
+            waiter.result.send_exception(
+                exception.VolumeBackendAPIException(data=msg))
+            return
+        waiter.next_poll = (time.time() +
+                            waiter.schedule.next_interval(progress))